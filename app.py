@@ -1,450 +1,503 @@
+import os
+
 import dash
 import dash_bootstrap_components as dbc
-from dash import dcc, html
-from dash.dependencies import Input, Output
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+from dash import Patch, dash_table, dcc, html
+from dash.dependencies import ClientsideFunction, Input, Output, State
+from dash.exceptions import PreventUpdate, UnsupportedRelativePath
+from flask import abort
+from plotly.io.json import to_json_plotly
+
+from cpi_cache import DatasetCache, content_digest
+from cpi_diff import diff_releases
+from cpi_figures import (BUILDERS, GRAINS, HEATMAP_VIEWS, PATCH_FIELDS, FigureFactory,
+                         apply_theme, figure_patch, revisions_spec)
+from cpi_http import body_etag, install_http_caching, revalidated
+from cpi_loader import load_dataset, period_labels, resolve_sources
+from cpi_memo import CallbackMemo
+from cpi_partition import rollups_from_env
+from cpi_sql import SQLStore, database_version, is_database
 
 # -----------------------
-# Data Processing Section
+# Datasets
 # -----------------------
-data = pd.read_csv("cpi Group data.csv")
-
-# Convert columns to numeric if necessary
-columns = ['Index', 'Inflation (%)']
-for column in columns:
-    if data[column].dtype == 'O':
-        data[column] = pd.to_numeric(data[column], errors='coerce')
-
-# Create Date and Month_Year columns
-data['Date'] = pd.to_datetime(
-    data['Year'].astype(str) + '-' + data['Month'], 
-    format='%Y-%B', errors='coerce'
-)
-data['Month_Year'] = data['Date'].dt.strftime('%b %y')
-data = data.sort_values('Date')
-data = data.dropna()
+# CPI_DATA is served at "/" and every CSV file or folder of releases inside
+# CPI_DATASETS at "/d/<name>" (file stem or folder name), so one deployment
+# can serve every region and base year.  Each source may be one CSV, a
+# directory of releases, a glob pattern or a database built with cpi_sql.py.
+DEFAULT_DATASET = 'default'
 
-# ---------------------------------------
-# Create Visualizations (Figures 1-12)
-# ---------------------------------------
-# Visualization 1: Average Inflation Rate by Group over Year
-fig1 = px.line(
-    data.groupby(['Year', 'Group'])['Inflation (%)'].mean().reset_index(),
-    x='Year', y='Inflation (%)', color='Group', markers=True,
-    title='Average Inflation Rate by Group'
-)
-fig1.update_traces(line=dict(width=2), marker=dict(size=8))
-fig1.update_layout(
-    template='plotly_white',
-    xaxis_title='Year', yaxis_title='Average Inflation (%)',
-    hovermode='x unified'
-)
-groups = data['Group'].unique()
-buttons = [dict(
-    label="All",
-    method="update",
-    args=[{"visible": [True] * len(fig1.data)},
-          {"title": "Average Inflation Rate for All Groups"}]
-)]
-for grp in groups:
-    visible = [trace.name == grp for trace in fig1.data]
-    buttons.append(dict(
-        label=str(grp),
-        method="update",
-        args=[{"visible": visible},
-              {"title": f"Average Inflation Rate for Group: {grp}"}]
-    ))
-fig1.update_layout(updatemenus=[dict(
-    active=0, buttons=buttons, x=1.35, y=1.10,
-    xanchor='right', yanchor='top'
-)])
-
-# Visualization 2: Average Inflation Rate by Years by Group
-fig2 = px.line(
-    data.groupby(['Year', 'Group'])['Inflation (%)'].mean().reset_index(),
-    x='Group', y='Inflation (%)', color='Year', markers=True,
-    title='Average Inflation Rate by Years'
-)
-fig2.update_traces(line=dict(width=2), marker=dict(size=8))
-fig2.update_layout(template='plotly_white', hovermode='x unified')
-years = data['Year'].unique()
-buttons = [dict(
-    label="All",
-    method="update",
-    args=[{"visible": [True] * len(fig2.data)},
-          {"title": "Average Inflation Rate by Group for All Years"}]
-)]
-for yr in years:
-    visible = [trace.name == str(yr) for trace in fig2.data]
-    buttons.append(dict(
-        label=str(yr),
-        method="update",
-        args=[{"visible": visible},
-              {"title": f"Average Inflation Rate by Group for Year: {yr}"}]
-    ))
-fig2.update_layout(updatemenus=[dict(
-    active=0, buttons=buttons, x=1.35, y=1.10,
-    xanchor='right', yanchor='top'
-)])
-
-# Visualization 3: Average Inflation Rate by States over Month_Year
-fig3 = px.line(
-    data.groupby(['Month_Year', 'State'])['Inflation (%)'].mean().reset_index(),
-    x='Month_Year', y='Inflation (%)', color='State', markers=True,
-    title='Average Inflation Rate by States'
-)
-fig3.update_traces(line=dict(width=2), marker=dict(size=8))
-fig3.update_layout(template='plotly_white', hovermode='x unified')
-states = data['State'].unique()
-buttons = [dict(
-    label="All",
-    method="update",
-    args=[{"visible": [True] * len(fig3.data)},
-          {"title": "Average Inflation Rate for all States"}]
-)]
-for st in states:
-    visible = [trace.name == str(st) for trace in fig3.data]
-    buttons.append(dict(
-        label=str(st),
-        method="update",
-        args=[{"visible": visible},
-              {"title": f"Average Inflation Rate for State: {st}"}]
-    ))
-fig3.update_layout(updatemenus=[dict(
-    active=0, buttons=buttons, x=1.35, y=1.10,
-    xanchor='right', yanchor='top'
-)])
-
-# Visualization 4: Average Inflation Rate for Months and Years by State
-fig4 = px.line(
-    data.groupby(['Month_Year', 'State'])['Inflation (%)'].mean().reset_index(),
-    x='State', y='Inflation (%)', color='Month_Year', markers=True,
-    title='Average Inflation Rate for Months and Year'
-)
-fig4.update_traces(line=dict(width=2), marker=dict(size=8))
-fig4.update_layout(template='plotly_white', hovermode='x unified')
-month_year = data['Month_Year'].unique()
-buttons = [dict(
-    label="All",
-    method="update",
-    args=[{"visible": [True] * len(fig4.data)},
-          {"title": "Average Inflation Rate for all months and Years"}]
-)]
-for mn_yr in month_year:
-    visible = [trace.name == str(mn_yr) for trace in fig4.data]
-    buttons.append(dict(
-        label=str(mn_yr),
-        method="update",
-        args=[{"visible": visible},
-              {"title": f"Average Inflation Rate for month and Year: {mn_yr}"}]
-    ))
-fig4.update_layout(updatemenus=[dict(
-    active=0, buttons=buttons, x=1.35, y=1.10,
-    xanchor='right', yanchor='top'
-)])
-
-# Visualization 5: Bar chart for monthly median inflation across years
-months = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
-          'August', 'September', 'October', 'November', 'December']
-traces = []
-for month in months:
-    month_data = data[data['Month'] == month]
-    if not month_data.empty:
-        month_grouped = month_data.groupby('Year')['Inflation (%)'].median().reset_index()
-        trace = go.Bar(
-            x=month_grouped['Year'], y=month_grouped['Inflation (%)'],
-            name=month,
-            marker=dict(color='rgb(150, 95, 100)', line=dict(width=1, color='black')),
-            visible=False
-        )
-    else:
-        trace = go.Bar(x=[], y=[], name=month, visible=False)
-    traces.append(trace)
-if traces:
-    traces[0]['visible'] = True
-buttons = []
-for i, month in enumerate(months):
-    visibility = [False] * len(months)
-    visibility[i] = True
-    buttons.append(dict(
-        label=month,
-        method="update",
-        args=[{"visible": visibility},
-              {"title": f"Average Inflation in {month} Across Years"}],
-    ))
-layout5 = go.Layout(
-    template='plotly_white',
-    updatemenus=[dict(
-        active=0, buttons=buttons, x=0.05, y=1.15,
-        xanchor='left', yanchor='top'
-    )],
-    title=f"Average Inflation in {months[0]} Across Years",
-    xaxis=dict(title="Year", tickmode='linear', dtick=1),
-    yaxis=dict(title="Average Inflation (%)"),
-    hovermode='x unified'
-)
-fig5 = go.Figure(data=traces, layout=layout5)
 
-# Visualization 6: Contribution Analysis with Pie and Stacked Bar Chart
-unique_months = sorted(
-    data['Month_Year'].unique(), 
-    key=lambda x: pd.to_datetime(x, format='%b %y')
-)
-fig6 = make_subplots(
-    rows=1, cols=2, specs=[[{'type': 'domain'}, {'type': 'xy'}]],
-    subplot_titles=("Contribution Pie Chart", "Contribution Stacked Bar Chart"),
-    horizontal_spacing=0.30
-)
-trace_indices = []
-all_traces = []
-for month in unique_months:
-    snapshot = data[data['Month_Year'] == month]
-    group_contrib = snapshot.groupby('Group')['Inflation (%)'].median().reset_index()
-    pie_trace = go.Pie(
-        labels=group_contrib['Group'],
-        values=group_contrib['Inflation (%)'],
-        textinfo='percent+label',
-        name=month
+def discover_datasets():
+    datasets = {DEFAULT_DATASET: os.environ.get("CPI_DATA", "cpi Group data.csv")}
+    root = os.environ.get("CPI_DATASETS")
+    if root:
+        for entry in sorted(os.listdir(root)):
+            path = os.path.join(root, entry)
+            stem, ext = os.path.splitext(entry)
+            if os.path.isdir(path):
+                datasets[entry] = path
+            elif ext.lower() == '.csv' or is_database(path):
+                datasets[stem] = path
+    return datasets
+
+
+datasets = discover_datasets()
+
+
+# Both follow the app's requests_pathname_prefix, so the app can be served
+# under a path prefix
+def dataset_path(name):
+    """URL of the page of dataset ``name``."""
+    return app.get_relative_path('/' if name == DEFAULT_DATASET else f'/d/{name}')
+
+
+def dataset_name(pathname):
+    """Dataset served at ``pathname``, or None if there is none."""
+    try:
+        path = app.strip_relative_path(pathname or app.config.requests_pathname_prefix)
+    except UnsupportedRelativePath:
+        return None
+    if not path:
+        return DEFAULT_DATASET
+    prefix, _, name = path.partition('/')
+    return name if prefix == 'd' and name in datasets else None
+
+
+# Cleaned frames, aggregates and figures of every dataset share one LRU cache
+# capped at CPI_CACHE_MB and keyed by content digest: a dataset is loaded on
+# its first request and evicted when others need the room.
+cache = DatasetCache.from_env()
+_versions = {}
+
+
+def source_version(source):
+    # Re-hash the files only when their size or modification time changed
+    signature = tuple((path, os.stat(path).st_mtime_ns, os.stat(path).st_size)
+                      for path in resolve_sources(source))
+    known = _versions.get(source)
+    if known is None or known[0] != signature:
+        version = database_version(source) if is_database(source) else content_digest(source)
+        known = _versions[source] = (signature, version)
+    return known[1]
+
+
+def dataset_version(name):
+    return source_version(datasets[name])
+
+
+def load(name):
+    """``(version, figure factory, rejected rows)`` for dataset ``name``.
+
+    Multiple files are parsed in parallel and overlapping months
+    deduplicated.  With CPI_ROLLUP_WORKERS set, the aggregates behind the
+    figures are reduced per Year partition in a process pool and the
+    dataset itself is never held in memory.  A database
+    is never loaded: every aggregate is a query over a pool of CPI_SQL_POOL
+    connections shared by the worker's threads.
+    """
+    source = datasets[name]
+    version = dataset_version(name)
+    if is_database(source):
+        store = cache.get_or_compute((version, 'store'), lambda: SQLStore.from_env(source))
+        return version, FigureFactory(None, cache=cache, version=version, rollups=store), store.rejected
+    rollups = cache.get_or_compute((version, 'rollups'), lambda: rollups_from_env(source))
+    if rollups is not None:
+        return version, FigureFactory(None, cache=cache, version=version, rollups=rollups), rollups.rejected
+    data, rejected = cache.get_or_compute(
+        (version, 'dataset'), lambda: load_dataset(source, with_report=True)
     )
-    current_indices = []
-    fig6.add_trace(pie_trace, row=1, col=1)
-    current_indices.append(len(all_traces))
-    all_traces.append(pie_trace)
-    group_contrib['dummy'] = 'Inflation Contribution'
-    temp_fig = px.bar(
-        group_contrib, x='dummy', y='Inflation (%)',
-        color='Group', color_discrete_sequence=px.colors.qualitative.Set3
+    previous, diff = load_previous(version, data) if name == DEFAULT_DATASET else (None, None)
+    return version, FigureFactory(data, cache=cache, version=version, previous=previous,
+                                  diff=diff), rejected
+
+
+def load_previous(version, data):
+    # CPI_COMPARE may point at the previous release of the default dataset:
+    # its row-level diff is shown in a Revisions tab, and aggregates and
+    # figures it already has cached are taken over where no revision
+    # touches them (e.g. when it is also served from CPI_DATASETS)
+    compare = os.environ.get("CPI_COMPARE")
+    if not compare or is_database(compare):
+        return None, None
+    prev_version = source_version(compare)
+    prev_data, _ = cache.get_or_compute(
+        (prev_version, 'dataset'), lambda: load_dataset(compare, with_report=True)
     )
-    bar_traces = list(temp_fig.data)
-    for trace in bar_traces:
-        fig6.add_trace(trace, row=1, col=2)
-        current_indices.append(len(all_traces))
-        all_traces.append(trace)
-    trace_indices.append(current_indices)
-fig6.update_layout(barmode='stack')
-total_traces = len(all_traces)
-buttons = []
-for i, month in enumerate(unique_months):
-    vis = [False] * total_traces
-    for idx in trace_indices[i]:
-        vis[idx] = True
-    buttons.append(dict(
-        label=month,
-        method="update",
-        args=[{"visible": vis},
-              {"title": f"Contribution Analysis for {month}"}]
-    ))
-fig6.update_layout(
-    updatemenus=[dict(
-        active=0, buttons=buttons, x=0.5, y=1.2,
-        xanchor='center', yanchor='top'
-    )],
-    title=f"Contribution Analysis for {unique_months[0]}",
-    template='plotly_white'
-)
+    diff = cache.get_or_compute(
+        (prev_version, version, 'diff'), lambda: diff_releases(prev_data, data)
+    )
+    return FigureFactory(prev_data, cache=cache, version=prev_version), diff
 
-# Visualization 7: Histogram and Boxplot (combined in one tab)
-fig7_hist = px.histogram(
-    data, x='Index', color='Group',
-    facet_col='Group', facet_col_wrap=3, template='plotly_white',
-    title='Distribution of Index Values by Group',
-    labels={'Index': 'Index Value'},
-    color_discrete_sequence=px.colors.qualitative.Plotly
-)
-fig7_hist.update_layout(bargap=0.1)
-fig7_box = px.box(
-    data, x='Group', y='Index',
-    title='Box Plot of Index Values by Group',
-    template='plotly_white',
-    labels={'Index': 'Index Value', 'Group': 'Group'},
-    color='Group', color_discrete_sequence=px.colors.qualitative.Plotly
-)
 
-# Visualization 8: Dynamic Time Window Analysis of Inflation
-fig8 = px.line(
-    data, x='Date', y='Inflation (%)',
-    title='Dynamic Time Window Analysis of Inflation'
-)
-fig8.update_traces(line=dict(width=2), marker=dict(size=8))
-fig8.update_layout(
-    template='plotly_white',
-    xaxis_title='Date', yaxis_title='Inflation (%)',
-    xaxis=dict(
-        showgrid=False,
-        rangeselector=dict(
-            buttons=[
-                dict(count=1, label="1m", step="month", stepmode="backward"),
-                dict(count=3, label="3m", step="month", stepmode="backward"),
-                dict(count=6, label="6m", step="month", stepmode="backward"),
-                dict(count=1, label="YTD", step="year", stepmode="todate"),
-                dict(count=1, label="1y", step="year", stepmode="backward"),
-                dict(step="all")
-            ]
-        ),
-        rangeslider=dict(visible=True),
-        type="date"
-    ),
-    hovermode='x unified'
-)
+# ---------------------------------------
+# Dataset page (Figures 1-12)
+# ---------------------------------------
+# Figures are built once per dataset, theme-free, by the shared factory; the
+# light theme is applied as a layout overlay.
+theme = 'light'
+
+# Vis 2, 4 and 5 can switch to a single-trace heatmap of the same matrix
+CHART_FORMS = {'chart': 'Lines / bars', 'heatmap': 'Heatmap'}
+
+# Filter and month changes of Vis 3 and Vis 6 are answered with a dash.Patch
+# of the trace data and title; CPI_FIGURE_PATCH=0 sends whole figures instead
+# (compare the callback bytes per interaction with loadtest.py --env)
+PATCH_FIGURES = os.environ.get("CPI_FIGURE_PATCH", "1") != "0"
+
+
+def graph_id(vis):
+    return vis.replace('_', '-') + '-graph'
+
+
+def vis6_months(figures):
+    # Vis 6 shows one month at a time, picked below the chart
+    return figures.median(['Period', 'Group'])['Period'].unique()
+
+
+def page_data(name):
+    """``(ETag, JSON body)`` of a dataset page's figures and cross-filter tables.
+
+    The body maps component ids to their properties, as a callback response
+    does; it is built once per dataset version.
+    """
+    version, figures, _ = load(name)
+
+    def build():
+        data = {graph_id(vis): {'figure': figures.figure(vis, theme)}
+                for vis in BUILDERS if vis != 'vis6'}
+        # Only the first month of Vis 6 is sent; the figure of every month
+        # is the heaviest to build and nobody receives it
+        months = vis6_months(figures)
+        params = {'period': int(months[0])} if len(months) else {}
+        data['vis6-graph'] = {'figure': figures.figure('vis6', theme, **params)}
+        # Sum/count marginals of the views cross-filtered in the browser
+        data['crossfilter-table'] = {'data': cache.get_or_compute((version, 'crossfilter'),
+                                                                  figures.crossfilter)}
+        body = to_json_plotly(data).encode()
+        return body_etag(version, body), body
+
+    return cache.get_or_compute((version, 'page.json'), build)
+
+
+def dataset_page(name):
+    # The page itself is a skeleton: its figures and cross-filter tables are
+    # fetched from page_data_url (see page_data), which the browser caches
+    # and revalidates per dataset version like the layout
+    version, figures, rejected = load(name)
+    months = vis6_months(figures)
+    crossfilter_data = cache.get_or_compute((version, 'crossfilter'), figures.crossfilter)
+
+    # Define tab items with dbc.Tabs for a cleaner look
+    tabs = dbc.Tabs([
+        dbc.Tab(dcc.Graph(id='vis1-graph'), label="Vis 1: Inflation by Group", tab_style={"fontFamily": "Arial, sans-serif"}),
+        dbc.Tab(dcc.Graph(id='vis2-graph'), label="Vis 2: Inflation by Year", tab_style={"fontFamily": "Arial, sans-serif"}),
+        dbc.Tab(dcc.Graph(id='vis3-graph'), label="Vis 3: Inflation by States", tab_style={"fontFamily": "Arial, sans-serif"}),
+        dbc.Tab(dcc.Graph(id='vis4-graph'), label="Vis 4: Inflation by Month & State", tab_style={"fontFamily": "Arial, sans-serif"}),
+        dbc.Tab(dcc.Graph(id='vis5-graph'), label="Vis 5: Median Inflation", tab_style={"fontFamily": "Arial, sans-serif"}),
+        dbc.Tab(html.Div([
+            dcc.Dropdown(
+                id='vis6-month',
+                options=[{'label': label, 'value': int(month)}
+                         for month, label in zip(months, period_labels(months))],
+                value=int(months[0]) if len(months) else None, clearable=False,
+                style={"marginTop": "15px", "width": "200px"}
+            ),
+            dcc.Graph(id='vis6-graph')
+        ]), label="Vis 6: Contribution Analysis", tab_style={"fontFamily": "Arial, sans-serif"}),
+        dbc.Tab(html.Div([
+            html.H4("Histogram", style={"textAlign": "center", "marginTop": "15px", "fontFamily": "Arial, sans-serif"}),
+            dcc.Graph(id='vis7-hist-graph'),
+            html.H4("Boxplot", style={"textAlign": "center", "marginTop": "15px", "fontFamily": "Arial, sans-serif"}),
+            dcc.Graph(id='vis7-box-graph')
+        ]), label="Vis 7: Distribution", tab_style={"fontFamily": "Arial, sans-serif"}),
+        dbc.Tab(dcc.Graph(id='vis8-graph'), label="Vis 8: Dynamic Time Analysis", tab_style={"fontFamily": "Arial, sans-serif"}),
+        dbc.Tab(html.Div([
+            dcc.RadioItems(
+                id='vis9-grain',
+                options=[{'label': f' {grain}', 'value': grain} for grain in GRAINS],
+                value='Year', inline=True,
+                inputStyle={"marginLeft": "15px"},
+                style={"marginTop": "15px", "fontFamily": "Arial, sans-serif"}
+            ),
+            dcc.Graph(id='vis9-graph')
+        ]), label="Vis 9: Sector Analysis", tab_style={"fontFamily": "Arial, sans-serif"}),
+        dbc.Tab(dcc.Graph(id='vis10-graph'), label="Vis 10: Group & Sector", tab_style={"fontFamily": "Arial, sans-serif"}),
+        dbc.Tab(dcc.Graph(id='vis11-graph'), label="Vis 11: Moving Std Dev", tab_style={"fontFamily": "Arial, sans-serif"}),
+        dbc.Tab(dcc.Graph(id='vis12-graph'), label="Vis 12: Volatility", tab_style={"fontFamily": "Arial, sans-serif"})
+    ], style={"marginTop": "20px"})
 
-# Visualization 9: Inflation by Sector with Timeline and Sector Dropdowns
-agg_year = data.groupby(['Year','Sector'])['Inflation (%)'].mean().reset_index()
-agg_month_year = data.groupby(['Month_Year','Sector'])['Inflation (%)'].mean().reset_index()
-sectors = data['Sector'].unique()
-fig9 = go.Figure()
-for sec in sectors:
-    df_sec = agg_year[agg_year['Sector'] == sec]
-    fig9.add_trace(go.Scatter(
-        x=df_sec['Year'], y=df_sec['Inflation (%)'],
-        mode='lines+markers', name=sec,
-        line=dict(width=2), marker=dict(size=8)
-    ))
-timeline_buttons = [
-    dict(
-        label="Year",
-        method="update",
-        args=[{"x": [agg_year[agg_year['Sector'] == sec]['Year'] for sec in sectors],
-               "y": [agg_year[agg_year['Sector'] == sec]['Inflation (%)'] for sec in sectors]},
-              {"title": "Average Inflation Rate by Year for Sectors"}]
-    ),
-    dict(
-        label="Month_Year",
-        method="update",
-        args=[{"x": [agg_month_year[agg_month_year['Sector'] == sec]['Month_Year'] for sec in sectors],
-               "y": [agg_month_year[agg_month_year['Sector'] == sec]['Inflation (%)'] for sec in sectors]},
-              {"title": "Average Inflation Rate by Month_Year for Sectors"}]
+    diff = figures.diff
+    if diff is not None:
+        revisions = diff.table()
+        tabs.children.append(dbc.Tab(html.Div([
+            dcc.Graph(figure=apply_theme(revisions_spec(diff), theme)),
+            dash_table.DataTable(
+                data=revisions.to_dict('records'),
+                columns=[{'name': column, 'id': column} for column in revisions.columns],
+                page_size=20, sort_action='native', filter_action='native',
+                style_table={"overflowX": "auto"}
+            )
+        ]), label="Revisions", tab_style={"fontFamily": "Arial, sans-serif"}))
+
+    # Cross-filter bar: a selection here (or a click on the Group/State axis of
+    # Vis 2, 4, 10 and 12) filters Vis 1, 2 and 10 in the browser; Vis 3 and
+    # Vis 4 are re-filtered on the server.
+    def filter_dropdown(dim):
+        return dbc.Col(dcc.Dropdown(
+            id=f'filter-{dim.lower()}',
+            options=[{'label': v, 'value': v} for v in crossfilter_data['dims'][dim]],
+            placeholder=f'All {dim}s'
+        ), md=4)
+
+    filter_bar = dbc.Row(
+        [filter_dropdown('State'), filter_dropdown('Group'), filter_dropdown('Sector')],
+        style={"marginTop": "20px"}
+    )
+
+    chart_form = dcc.RadioItems(
+        id='chart-form',
+        options=[{'label': f' {label}', 'value': form} for form, label in CHART_FORMS.items()],
+        value='chart', inline=True,
+        inputStyle={"marginLeft": "15px"},
+        style={"marginTop": "15px", "fontFamily": "Arial, sans-serif"}
     )
-]
-sector_buttons = [dict(
-    label="All",
-    method="update",
-    args=[{"visible": [True] * len(sectors)},
-          {"title": "Average Inflation Rate for All Sectors"}]
-)]
-for i, sec in enumerate(sectors):
-    vis = [False] * len(sectors)
-    vis[i] = True
-    sector_buttons.append(dict(
-        label=sec,
-        method="update",
-        args=[{"visible": vis},
-              {"title": f"Average Inflation Rate for Sector: {sec}"}]
-    ))
-fig9.update_layout(
-    template="plotly_white",
-    updatemenus=[
-        dict(
-            buttons=timeline_buttons, direction="down",
-            pad={"r": 10, "t": 10}, showactive=True,
-            x=0.1, y=1.15, xanchor="left", yanchor="top", active=0
+
+    # Summary of the rows dropped while cleaning (empty when nothing was rejected)
+    rejected_alert = dbc.Alert(
+        "Rejected rows while loading: " + "; ".join(
+            f"{reason} ({count})" for reason, count in rejected.groupby('reason')['rows'].sum().items()
         ),
-        dict(
-            buttons=sector_buttons, direction="down",
-            pad={"r": 10, "t": 10}, showactive=True,
-            x=0.35, y=1.15, xanchor="left", yanchor="top", active=0
-        )
-    ]
-)
+        color="warning", dismissable=True, is_open=not rejected.empty,
+        style={"marginTop": "20px"}
+    )
 
-# Visualization 10: Aggregated Inflation by Group and Sector
-fig10 = px.bar(
-    data.groupby(['Group', 'Sector'])['Inflation (%)'].mean().reset_index(),
-    x='Group', y='Inflation (%)', color='Sector', barmode='group',
-    title='Aggregated Inflation by Group and Sector'
-)
-fig10.update_traces(marker_line=dict(width=1, color='black'))
-fig10.update_layout(template='plotly_white', hovermode='x unified')
-
-# Visualization 11: Moving Standard Deviation of Inflation Rate by Sector
-df_avg = data.groupby(['Month_Year', 'Sector'])['Inflation (%)'].mean().reset_index()
-window = 5
-df_avg['moving_std'] = df_avg.groupby('Sector')['Inflation (%)'].transform(lambda x: x.rolling(window, min_periods=1).std())
-fig11 = px.line(
-    df_avg, x='Month_Year', y='moving_std', color='Sector',
-    markers=True, title='Moving Standard Deviation of Inflation Rate by Sector'
-)
-fig11.update_traces(line=dict(width=2), marker=dict(size=8))
-sectors_list = df_avg['Sector'].unique()
-buttons = [dict(
-    label="All",
-    method="update",
-    args=[{"visible": [True] * len(fig11.data)},
-          {"title": "Moving Standard Deviation of Inflation Rate by Sector: All"}]
-)]
-for sec in sectors_list:
-    visibility = [trace.name == sec for trace in fig11.data]
-    buttons.append(dict(
-        label=str(sec),
-        method="update",
-        args=[{"visible": visibility},
-              {"title": f"Moving Standard Deviation of Inflation Rate for Sector: {sec}"}]
-    ))
-fig11.update_layout(
-    template='plotly_white',
-    updatemenus=[dict(
-        active=0, buttons=buttons, x=1.15, y=1.15,
-        xanchor="right", yanchor="top"
-    )]
-)
+    return html.Div([
+        rejected_alert,
+        dcc.Store(id='page-data-url', data=dataset_path(name).rstrip('/') + '/page.json'),
+        dcc.Store(id='crossfilter-table'),
+        dcc.Store(id='crossfilter-selection', data={}),
+        dbc.Container([filter_bar, chart_form, tabs], fluid=True, style={"marginTop": "30px"})
+    ])
 
-# Visualization 12: Overall Inflation Volatility by Group
-data_avg = data.groupby(['Month_Year', 'Group'])['Inflation (%)'].mean().reset_index()
-volatility_data = data_avg.groupby('Group')['Inflation (%)'].std().reset_index()
-volatility_data.rename(columns={'Inflation (%)': 'Overall Volatility'}, inplace=True)
-fig12 = px.bar(
-    volatility_data, x='Group', y='Overall Volatility', color='Group',
-    title='Overall Inflation Volatility by Group',
-    color_discrete_sequence=px.colors.qualitative.Plotly
-)
-fig12.update_traces(marker_line=dict(width=1, color='black'))
-fig12.update_layout(template='plotly_white', hovermode='x unified')
 
 # -------------------------------
 # Build the Dash App Layout
 # -------------------------------
 external_stylesheets = [dbc.themes.CERULEAN]
 
-app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
+# Pages are rendered per URL, so callbacks refer to components that only
+# exist once a dataset page is shown
+app = dash.Dash(__name__, external_stylesheets=external_stylesheets,
+                suppress_callback_exceptions=True)
 server = app.server
 
-# Create a stylish Navbar
+# Layout/index responses carry a dataset-version ETag (repeat visits get a
+# 304) and fingerprinted assets are cached by the browser for a year
+install_http_caching(app, dataset_version(DEFAULT_DATASET))
+
+# Create a stylish Navbar with a link to every dataset
 navbar = dbc.NavbarSimple(
+    children=[dbc.DropdownMenu(
+        [dbc.DropdownMenuItem(name, href=dataset_path(name)) for name in datasets],
+        label="Dataset", nav=True, in_navbar=True
+    )] if len(datasets) > 1 else [],
     brand="Inflation Dashboard",
-    brand_href="#",
+    brand_href=dataset_path(DEFAULT_DATASET),
     color="primary",
     dark=True,
     style={"fontFamily": "Arial, sans-serif"}
 )
 
-# Define tab items with dbc.Tabs for a cleaner look
-tabs = dbc.Tabs([
-    dbc.Tab(dcc.Graph(figure=fig1), label="Vis 1: Inflation by Group", tab_style={"fontFamily": "Arial, sans-serif"}),
-    dbc.Tab(dcc.Graph(figure=fig2), label="Vis 2: Inflation by Year", tab_style={"fontFamily": "Arial, sans-serif"}),
-    dbc.Tab(dcc.Graph(figure=fig3), label="Vis 3: Inflation by States", tab_style={"fontFamily": "Arial, sans-serif"}),
-    dbc.Tab(dcc.Graph(figure=fig4), label="Vis 4: Inflation by Month & State", tab_style={"fontFamily": "Arial, sans-serif"}),
-    dbc.Tab(dcc.Graph(figure=fig5), label="Vis 5: Median Inflation", tab_style={"fontFamily": "Arial, sans-serif"}),
-    dbc.Tab(dcc.Graph(figure=fig6), label="Vis 6: Contribution Analysis", tab_style={"fontFamily": "Arial, sans-serif"}),
-    dbc.Tab(html.Div([
-        html.H4("Histogram", style={"textAlign": "center", "marginTop": "15px", "fontFamily": "Arial, sans-serif"}),
-        dcc.Graph(figure=fig7_hist),
-        html.H4("Boxplot", style={"textAlign": "center", "marginTop": "15px", "fontFamily": "Arial, sans-serif"}),
-        dcc.Graph(figure=fig7_box)
-    ]), label="Vis 7: Distribution", tab_style={"fontFamily": "Arial, sans-serif"}),
-    dbc.Tab(dcc.Graph(figure=fig8), label="Vis 8: Dynamic Time Analysis", tab_style={"fontFamily": "Arial, sans-serif"}),
-    dbc.Tab(dcc.Graph(figure=fig9), label="Vis 9: Sector Analysis", tab_style={"fontFamily": "Arial, sans-serif"}),
-    dbc.Tab(dcc.Graph(figure=fig10), label="Vis 10: Group & Sector", tab_style={"fontFamily": "Arial, sans-serif"}),
-    dbc.Tab(dcc.Graph(figure=fig11), label="Vis 11: Moving Std Dev", tab_style={"fontFamily": "Arial, sans-serif"}),
-    dbc.Tab(dcc.Graph(figure=fig12), label="Vis 12: Volatility", tab_style={"fontFamily": "Arial, sans-serif"})
-], style={"marginTop": "20px"})
-
-# Build the layout with a container
+# Build the layout with a container; the page follows the URL
 app.layout = dbc.Container([
+    dcc.Location(id='url'),
     navbar,
-    dbc.Container(tabs, fluid=True, style={"marginTop": "30px"})
+    html.Div(id='page')
 ], fluid=True, style={"fontFamily": "Arial, sans-serif", "backgroundColor": "#f8f9fa", "padding": "20px"})
 
+# Load the default dataset up front so the first visitor doesn't wait
+page_data(DEFAULT_DATASET)
+
+# -------------------------------
+# Server callbacks
+# -------------------------------
+@app.callback(
+    Output('page', 'children'),
+    Input('url', 'pathname')
+)
+def render_page(pathname):
+    name = dataset_name(pathname)
+    if name is None:
+        links = [html.A(name, href=dataset_path(name), style={"marginRight": "10px"})
+                 for name in datasets]
+        return dbc.Alert([html.P(f"No dataset at {pathname}."), html.Div(links)],
+                         color="danger", style={"marginTop": "20px"})
+    return dataset_page(name)
+
+
+# Page data, served over GET with a dataset-version ETag: a repeat visit
+# revalidates it and gets an empty 304
+@server.route(app.config.routes_pathname_prefix + 'page.json')
+@server.route(app.config.routes_pathname_prefix + 'd/<name>/page.json')
+def serve_page_data(name=DEFAULT_DATASET):
+    if name not in datasets:
+        abort(404)
+    return revalidated(*page_data(name))
+
+
+# Results are memoized on their arguments, which include the dataset version
+# (CPI_MEMO_BACKEND=memory|filesystem, CPI_MEMO_TTL seconds); concurrent
+# identical requests compute once.
+memo = CallbackMemo.from_env()
+
+
+@memo.memoize()
+def vis9_figure(name, version, grain):
+    return load(name)[1].figure('vis9', theme, grain=grain)
+
+
+# Vis 9 time grain (served from cached per-grain aggregates)
+@app.callback(
+    Output('vis9-graph', 'figure'),
+    Input('vis9-grain', 'value'),
+    State('url', 'pathname'),
+    prevent_initial_call=True
+)
+def update_vis9_grain(grain, pathname):
+    name = dataset_name(pathname)
+    if name is None or grain not in GRAINS:
+        raise PreventUpdate
+    return vis9_figure(name, dataset_version(name), grain)
+
+
+@memo.memoize()
+def chart_form_figures(name, version, form):
+    figures = load(name)[1]
+    return [figures.figure(vis, theme, heatmap=form == 'heatmap') for vis in FORM_VIEWS]
+
+
+# Line/bar or heatmap form of Vis 2 and 5 (Vis 4 follows it in update_vis4)
+FORM_VIEWS = [vis for vis in HEATMAP_VIEWS if vis != 'vis4']
+
+
+@app.callback(
+    [Output(f'{vis}-graph', 'figure', allow_duplicate=True) for vis in FORM_VIEWS]
+    + [Output('crossfilter-selection', 'data', allow_duplicate=True)],
+    Input('chart-form', 'value'),
+    State('url', 'pathname'),
+    State('crossfilter-selection', 'data'),
+    prevent_initial_call=True
+)
+def update_chart_form(form, pathname, selection):
+    name = dataset_name(pathname)
+    if name is None or form not in CHART_FORMS:
+        raise PreventUpdate
+    # Re-emit the selection so the client-side filters apply to the new form
+    return chart_form_figures(name, dataset_version(name), form) + [selection]
+
+
+@memo.memoize()
+def figure_updates(name, version, vis, **params):
+    return figure_patch(load(name)[1].spec(vis, **params), PATCH_FIELDS[vis])
+
+
+def figure_update(name, vis, **params):
+    """``vis`` with ``params`` as a dash.Patch of its changing fields (or whole)."""
+    if not PATCH_FIGURES:
+        return load(name)[1].figure(vis, theme, **params)
+    patch = Patch()
+    for path, value in figure_updates(name, dataset_version(name), vis, **params):
+        target = patch
+        for key in path[:-1]:
+            target = target[key]
+        target[path[-1]] = value
+    return patch
+
+
+# Vis 3 filtered by the selected Group and Sector
+@app.callback(
+    Output('vis3-graph', 'figure'),
+    Input('filter-group', 'value'),
+    Input('filter-sector', 'value'),
+    State('url', 'pathname'),
+    prevent_initial_call=True
+)
+def update_vis3_filter(group, sector, pathname):
+    name = dataset_name(pathname)
+    if name is None:
+        raise PreventUpdate
+    return figure_update(name, 'vis3', group=group, sector=sector)
+
+
+# Vis 4 filtered by the selected Group and Sector, in the selected form
+@app.callback(
+    Output('vis4-graph', 'figure', allow_duplicate=True),
+    Input('filter-group', 'value'),
+    Input('filter-sector', 'value'),
+    Input('chart-form', 'value'),
+    State('url', 'pathname'),
+    prevent_initial_call=True
+)
+def update_vis4(group, sector, form, pathname):
+    name = dataset_name(pathname)
+    if name is None or form not in CHART_FORMS:
+        raise PreventUpdate
+    params = dict(heatmap=form == 'heatmap', group=group, sector=sector)
+    if dash.ctx.triggered_id == 'chart-form':
+        # A new form has other traces, so it is sent whole
+        return load(name)[1].figure('vis4', theme, **params)
+    return figure_update(name, 'vis4', **params)
+
+
+# Vis 6 month
+@app.callback(
+    Output('vis6-graph', 'figure'),
+    Input('vis6-month', 'value'),
+    State('url', 'pathname'),
+    prevent_initial_call=True
+)
+def update_vis6_month(period, pathname):
+    name = dataset_name(pathname)
+    if name is None or period is None:
+        raise PreventUpdate
+    return figure_update(name, 'vis6', period=period)
+
+# -------------------------------
+# Client-side page data and cross-filtering
+# -------------------------------
+# Fill the page skeleton from its page.json (the other callbacks writing
+# these figures update them afterwards)
+app.clientside_callback(
+    ClientsideFunction(namespace='cpi', function_name='loadPage'),
+    [Output(graph_id(vis), 'figure', allow_duplicate=True) for vis in BUILDERS]
+    + [Output('crossfilter-table', 'data')],
+    Input('page-data-url', 'data'),
+    prevent_initial_call='initial_duplicate'
+)
+app.clientside_callback(
+    ClientsideFunction(namespace='cpi', function_name='updateSelection'),
+    [Output('crossfilter-selection', 'data'),
+     Output('filter-state', 'value'),
+     Output('filter-group', 'value'),
+     Output('filter-sector', 'value')],
+    [Input('filter-state', 'value'),
+     Input('filter-group', 'value'),
+     Input('filter-sector', 'value'),
+     Input('vis2-graph', 'clickData'),
+     Input('vis4-graph', 'clickData'),
+     Input('vis10-graph', 'clickData'),
+     Input('vis12-graph', 'clickData')]
+)
+for vis in ['1', '2', '10']:
+    app.clientside_callback(
+        ClientsideFunction(namespace='cpi', function_name=f'filterVis{vis}'),
+        Output(f'vis{vis}-graph', 'figure'),
+        Input('crossfilter-selection', 'data'),
+        State('crossfilter-table', 'data'),
+        State(f'vis{vis}-graph', 'figure'),
+        prevent_initial_call=True
+    )
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,142 @@
+// Client-side page loading and cross-filtering for the Dash app.
+//
+// A dataset page is rendered as a skeleton; loadPage fills its figures and
+// the cross-filter tables from the page's page.json, a GET the browser
+// caches and revalidates (see app.page_data).
+//
+// The server ships small sum/count marginal tables (see
+// cpi_figures.crossfilter_table) in a dcc.Store, one per client-filtered
+// view.  Selecting a State, Group or Sector re-aggregates the view's table
+// in the browser and swaps the y values of the figure, so filtering Vis 1,
+// 2 and 10 never round-trips to the server.
+(function () {
+    var DTYPES = {
+        f8: Float64Array, f4: Float32Array,
+        i4: Int32Array, u4: Uint32Array,
+        i2: Int16Array, u2: Uint16Array,
+        i1: Int8Array, u1: Uint8Array
+    };
+
+    // Plotly may ship numeric arrays base64-encoded ({dtype, bdata}).
+    function toArray(value) {
+        if (value && value.bdata !== undefined) {
+            var raw = atob(value.bdata);
+            var bytes = new Uint8Array(raw.length);
+            for (var i = 0; i < raw.length; i++) {
+                bytes[i] = raw.charCodeAt(i);
+            }
+            return Array.from(new DTYPES[value.dtype](bytes.buffer));
+        }
+        return value || [];
+    }
+
+    // Mean of the named table per (xDim, seriesDim) cell, honouring every
+    // active selection except the view's own dimensions.
+    function filterView(name, xDim, seriesDim) {
+        return function (selection, store, figure) {
+            var table = store && store.tables[name];
+            if (!table || !figure) {
+                return window.dash_clientside.no_update;
+            }
+            selection = selection || {};
+            var active = Object.keys(selection).filter(function (dim) {
+                return selection[dim] && dim !== xDim && dim !== seriesDim;
+            });
+            var wanted = active.map(function (dim) {
+                return store.dims[dim].indexOf(selection[dim]);
+            });
+            var xLabels = store.dims[xDim], seriesLabels = store.dims[seriesDim];
+            var xCodes = table.codes[xDim], seriesCodes = table.codes[seriesDim];
+            var cells = {};
+            for (var r = 0; r < table.sum.length; r++) {
+                var keep = true;
+                for (var k = 0; k < active.length; k++) {
+                    if (table.codes[active[k]][r] !== wanted[k]) {
+                        keep = false;
+                        break;
+                    }
+                }
+                if (!keep) {
+                    continue;
+                }
+                var key = xLabels[xCodes[r]] + '\u0000' + seriesLabels[seriesCodes[r]];
+                var cell = cells[key] || (cells[key] = [0, 0]);
+                cell[0] += table.sum[r];
+                cell[1] += table.count[r];
+            }
+            function mean(x, series) {
+                var cell = cells[String(x) + '\u0000' + String(series)];
+                return cell ? cell[0] / cell[1] : null;
+            }
+            var data = figure.data.map(function (trace) {
+                var xs = toArray(trace.x);
+                // Heatmap form: one trace with xDim columns and seriesDim rows
+                if (trace.type === 'heatmap') {
+                    var z = toArray(trace.y).map(function (series) {
+                        return xs.map(function (x) {
+                            return mean(x, series);
+                        });
+                    });
+                    return Object.assign({}, trace, {x: xs, z: z});
+                }
+                var ys = xs.map(function (x) {
+                    return mean(x, trace.name);
+                });
+                return Object.assign({}, trace, {x: xs, y: ys});
+            });
+            return Object.assign({}, figure, {data: data});
+        };
+    }
+
+    // {id: {property: value}} of the page, in the order of the outputs.
+    function loadPage(url) {
+        var dc = window.dash_clientside;
+        // The callback context only lives until this function returns
+        var outputs = dc.callback_context.outputs_list;
+        if (!url) {
+            throw dc.PreventUpdate;
+        }
+        return fetch(url, {credentials: 'same-origin'}).then(function (response) {
+            if (!response.ok) {
+                throw new Error('Loading ' + url + ' failed: ' + response.status);
+            }
+            return response.json();
+        }).then(function (page) {
+            return outputs.map(function (output) {
+                var props = page[output.id] || {};
+                var property = output.property.split('@')[0];
+                return property in props ? props[property] : dc.no_update;
+            });
+        });
+    }
+
+    // Charts whose x axis is a filterable dimension act as selectors.
+    var CLICK_SOURCES = {
+        'vis2-graph.clickData': 'Group',
+        'vis4-graph.clickData': 'State',
+        'vis10-graph.clickData': 'Group',
+        'vis12-graph.clickData': 'Group'
+    };
+
+    function updateSelection(state, group, sector) {
+        var ctx = window.dash_clientside.callback_context;
+        var selected = {State: state || null, Group: group || null, Sector: sector || null};
+        ctx.triggered.forEach(function (trigger) {
+            var dim = CLICK_SOURCES[trigger.prop_id];
+            if (dim && trigger.value && trigger.value.points.length) {
+                selected[dim] = String(trigger.value.points[0].x);
+            }
+        });
+        return [selected, selected.State, selected.Group, selected.Sector];
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        cpi: {
+            loadPage: loadPage,
+            updateSelection: updateSelection,
+            filterVis1: filterView('year', 'Year', 'Group'),
+            filterVis2: filterView('year', 'Group', 'Year'),
+            filterVis10: filterView('sector', 'Group', 'Sector')
+        }
+    });
+})();
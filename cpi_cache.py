@@ -0,0 +1,148 @@
+"""Shared, memory-bounded cache for parsed datasets and their aggregates.
+
+Entries are keyed by the content digest of the source files, so every
+session that uploads the same export shares one parsed frame and one set
+of figures.  The cache evicts least-recently-used entries once the
+estimated size of what it holds exceeds ``max_bytes``.
+"""
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from cpi_loader import resolve_sources
+
+
+def content_digest(source):
+    """SHA-256 over the bytes of every file in ``source`` (path(s) or file objects)."""
+    digest = hashlib.sha256()
+    for item in resolve_sources(source):
+        if hasattr(item, 'getvalue'):
+            digest.update(item.getvalue())
+        else:
+            with open(item, 'rb') as fh:
+                for block in iter(lambda: fh.read(1 << 20), b''):
+                    digest.update(block)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def estimate_size(obj):
+    """Rough in-memory size of ``obj`` in bytes."""
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(obj, np.ndarray) or isinstance(getattr(obj, 'nbytes', None), int):
+        # Arrays and array containers such as cpi_panel.Panel
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(estimate_size(v) for v in obj)
+    return sys.getsizeof(obj)
+
+
+class DatasetCache:
+    """Thread-safe LRU cache bounded by the estimated size of its entries.
+
+    Behaves like a dict for ``get``/``[]``/``in`` so it can back a
+    :class:`cpi_figures.FigureFactory`.  ``stats()`` reports hits, misses,
+    evictions and the current footprint.
+    """
+
+    def __init__(self, max_bytes=512 * 2**20):
+        self.max_bytes = int(max_bytes)
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._computing = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_env(cls, variable='CPI_CACHE_MB', default_mb=512):
+        return cls(max_bytes=float(os.environ.get(variable, default_mb)) * 2**20)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def __getitem__(self, key):
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        size = estimate_size(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            if size > self.max_bytes:
+                # Never worth evicting everything else for one oversized entry
+                return
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """Cached value for ``key``; concurrent misses on one key compute it once."""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is not sentinel:
+            return value
+        with self._lock:
+            pending = self._computing.setdefault(key, threading.Lock())
+        try:
+            with pending:
+                with self._lock:
+                    entry = self._entries.get(key)
+                if entry is not None:
+                    return entry[0]
+                value = compute()
+                self[key] = value
+                return value
+        finally:
+            with self._lock:
+                self._computing.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return dict(
+                entries=len(self._entries),
+                bytes=self.bytes,
+                max_bytes=self.max_bytes,
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                hit_rate=self.hits / lookups if lookups else 0.0,
+            )
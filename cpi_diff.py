@@ -0,0 +1,108 @@
+"""Row-level diff between two releases of the CPI dataset.
+
+Rows are matched on a 64-bit hash of their key columns and compared on a
+hash of each value column, so the whole diff is a few vectorized hashes and
+one merge.  The result lists added, removed and revised rows and tells the
+figure factory which groups a revision touches (see
+:class:`cpi_figures.FigureFactory` ``previous``/``diff``), so only those
+aggregates and figures are rebuilt.
+"""
+import numpy as np
+import pandas as pd
+
+from cpi_loader import KEY_COLUMNS, NUMERIC_COLUMNS, period_labels
+
+CHANGES = ['added', 'removed', 'revised']
+
+
+def _hash(frame, columns):
+    return pd.util.hash_pandas_object(frame[columns], index=False).to_numpy()
+
+
+class ReleaseDiff:
+    """Changed rows between two releases.
+
+    ``revisions`` has the key columns, ``change`` ('added', 'removed' or
+    'revised'), ``<value> (old)``/``<value> (new)`` for every value column
+    and a ``<value> changed`` flag per value column.
+    """
+
+    def __init__(self, revisions, keys=KEY_COLUMNS, values=NUMERIC_COLUMNS):
+        self.revisions = revisions
+        self.keys = list(keys)
+        self.values = list(values)
+
+    @property
+    def nbytes(self):
+        return int(self.revisions.memory_usage(deep=True).sum())
+
+    @property
+    def empty(self):
+        return self.revisions.empty
+
+    def counts(self):
+        return self.revisions['change'].value_counts().reindex(CHANGES, fill_value=0).to_dict()
+
+    def table(self):
+        """Revisions for display: 'Month_Year' labels, old/new values, no flags."""
+        rows = self.revisions.drop(columns=[f'{value} changed' for value in self.values])
+        if 'Period' in rows:
+            rows.insert(0, 'Month_Year', period_labels(rows['Period']))
+            rows = rows.drop(columns='Period')
+        return rows
+
+    def touched(self, value):
+        """Key columns (plus ``Year``) of the rows whose ``value`` differs."""
+        rows = self.revisions
+        mask = (rows['change'] != 'revised') | rows[f'{value} changed']
+        touched = rows.loc[mask, self.keys]
+        return touched.assign(Year=touched['Period'] // 12)
+
+
+def diff_releases(old, new, keys=KEY_COLUMNS, values=NUMERIC_COLUMNS):
+    """Compare two cleaned releases (as returned by ``load_dataset``).
+
+    Keys are unique within a release (rows repeating a key are dropped
+    here too, the last one winning as in ``load_dataset``), so matching is
+    a hash join of the new key hashes against an index of the old ones.
+    """
+    keys = [key for key in keys if key in old.columns and key in new.columns]
+    old, new = (frame.drop_duplicates(subset=keys, keep='last') for frame in (old, new))
+    match = pd.Index(_hash(old, keys)).get_indexer(_hash(new, keys))
+    matched = match >= 0
+    old_rows, new_rows = match[matched], np.flatnonzero(matched)
+    changed = {value: _hash(old, [value])[old_rows] != _hash(new, [value])[new_rows]
+               for value in values}
+    revised = np.logical_or.reduce(list(changed.values()))
+    removed = np.ones(len(old), dtype=bool)
+    removed[old_rows] = False
+
+    # (change, old row or -1, new row or -1) for every differing row
+    parts = [
+        ('added', np.full((~matched).sum(), -1), np.flatnonzero(~matched)),
+        ('removed', np.flatnonzero(removed), np.full(removed.sum(), -1)),
+        ('revised', old_rows[revised], new_rows[revised]),
+    ]
+    change = np.concatenate([np.full(len(rows), name, dtype=object) for name, rows, _ in parts])
+    old_pick = np.concatenate([rows for _, rows, _ in parts]).astype(np.int64)
+    new_pick = np.concatenate([rows for _, _, rows in parts]).astype(np.int64)
+    has_old, has_new = old_pick >= 0, new_pick >= 0
+
+    columns = {}
+    for key in keys:
+        column = new[key].to_numpy()[new_pick]
+        column[~has_new] = old[key].to_numpy()[old_pick[~has_new]]
+        columns[key] = column
+    columns['change'] = change
+    for value in values:
+        old_values, new_values = old[value].to_numpy(dtype=float), new[value].to_numpy(dtype=float)
+        columns[f'{value} (old)'] = np.where(has_old, old_values[old_pick], np.nan)
+        columns[f'{value} (new)'] = np.where(has_new, new_values[new_pick], np.nan)
+        columns[f'{value} changed'] = np.concatenate([
+            np.ones(len(parts[0][1]) + len(parts[1][1]), dtype=bool), changed[value][revised]
+        ])
+    revisions = pd.DataFrame(columns)
+    if 'Period' in revisions:
+        revisions['Period'] = revisions['Period'].astype(np.int64)
+    revisions = revisions.sort_values(keys, kind='stable').reset_index(drop=True)
+    return ReleaseDiff(revisions, keys, values)
@@ -0,0 +1,905 @@
+"""Theme-independent figure factory shared by the Dash and Streamlit apps.
+
+Each visualization is built once per dataset without any theme and kept as
+a plain figure dict.  A theme is a layout-only overlay (template, colors,
+fonts) merged in when the figure is served, so the light Dash app and the
+dark Streamlit app reuse the same aggregation and trace data.
+"""
+import copy
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.subplots import make_subplots
+
+from cpi_loader import period_dates, period_labels
+from cpi_panel import Panel
+from cpi_stats import box_summary, histogram_summary
+
+MONTHS = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+          'August', 'September', 'October', 'November', 'December']
+
+# -----------------------
+# Themes (layout overlays)
+# -----------------------
+dark_layout = dict(
+    template='plotly_dark',
+    plot_bgcolor='rgba(0,0,0,0)',
+    paper_bgcolor='rgba(0,0,0,0)',
+    title_font=dict(size=18, family='Arial', color='white'),
+    xaxis=dict(
+        showgrid=True,
+        gridcolor='grey',
+        showline=True,
+        linewidth=1,
+        linecolor='white',
+        tickfont=dict(size=12, color='white'),
+        title_font=dict(size=14, color='white'),
+    ),
+    yaxis=dict(
+        showgrid=True,
+        gridcolor='grey',
+        showline=True,
+        linewidth=1,
+        linecolor='white',
+        tickfont=dict(size=12, color='white'),
+        title_font=dict(size=14, color='white'),
+    ),
+    hovermode='x unified',
+    legend=dict(font=dict(color='white'))
+)
+
+light_layout = dict(template='plotly_white')
+
+THEMES = {
+    'light': dict(layout=light_layout, bar_line_color='black', menu_bgcolor=None),
+    'dark': dict(layout=dark_layout, bar_line_color='white', menu_bgcolor='rgba(0,0,0,0)'),
+}
+
+
+def register_theme(name, layout, bar_line_color='black', menu_bgcolor=None):
+    """Add (or replace) a theme; no figure needs to be rebuilt."""
+    THEMES[name] = dict(layout=layout, bar_line_color=bar_line_color, menu_bgcolor=menu_bgcolor)
+    _theme_overlay.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def _theme_overlay(name):
+    # Expand the theme once into a plain layout dict with the template
+    # inlined.  Bar outlines and dropdown colors go through the template's
+    # defaults so the overlay never has to touch trace data.
+    theme = THEMES[name]
+    overlay = go.Layout(theme['layout']).to_plotly_json()
+    template = overlay.get('template') or pio.templates[pio.templates.default].to_plotly_json()
+    template = copy.deepcopy(template)
+    bars = template.setdefault('data', {}).setdefault('bar', [{}])
+    for bar in bars:
+        bar.setdefault('marker', {}).setdefault('line', {})['color'] = theme['bar_line_color']
+    if theme['menu_bgcolor']:
+        template.setdefault('layout', {})['updatemenudefaults'] = dict(
+            bgcolor=theme['menu_bgcolor'], bordercolor=theme['menu_bgcolor']
+        )
+    overlay['template'] = template
+    return overlay
+
+
+def _merge(base, overlay):
+    merged = dict(base)
+    for key, value in overlay.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def apply_theme(spec, theme):
+    """Return ``spec`` with the theme overlay merged into its layout.
+
+    Trace data is shared with the cached spec, not copied.
+    """
+    return dict(spec, layout=_merge(spec['layout'], _theme_overlay(theme)))
+
+
+# Time grains selectable for Vis 9 (name -> integer key column)
+GRAINS = {'Year': 'Year', 'Quarter': 'Quarter', 'Month_Year': 'Period'}
+
+# Grouping keys derived from Period on the fly instead of stored on the dataset
+DERIVED_KEYS = {
+    'Quarter': lambda data: data['Period'] // 3,
+    'Month_Num': lambda data: data['Period'] % 12,
+}
+
+
+def quarter_labels(quarters):
+    quarters = np.asarray(quarters, dtype=np.int64)
+    return np.array([f"{q // 4} Q{q % 4 + 1}" for q in quarters.tolist()], dtype=object)
+
+
+# Render-time labels for integer time keys
+KEY_LABELS = {'Period': period_labels, 'Quarter': quarter_labels}
+
+
+def _period_axis(periods):
+    # Keep categorical month labels in chronological order on the axis
+    return dict(type='category', categoryorder='array',
+                categoryarray=period_labels(np.unique(periods)))
+
+
+def _with_month_year(df):
+    return df.assign(Month_Year=period_labels(df['Period']))
+
+
+def _panel_traces(panel, values, labels, series=None, connectgaps=False, **trace):
+    # One line per panel column, skipping the periods the series has no value
+    # for (or keeping them as gaps the line is drawn across, so every trace
+    # shares the x axis values)
+    columns = {name: j for j, name in enumerate(panel.series)}
+    if connectgaps:
+        trace['connectgaps'] = True
+    traces = []
+    for name in panel.series if series is None else series:
+        y = values[:, columns[name]]
+        keep = slice(None) if connectgaps else ~np.isnan(y)
+        traces.append(go.Scatter(x=labels[keep], y=y[keep], name=str(name),
+                                 mode='lines+markers', **trace))
+    return traces
+
+
+def _heatmap(pivot, x, y, title, value='Inflation (%)'):
+    # The whole series x category matrix as one trace: payload and render cost
+    # grow with the number of cells, not with one trace per series
+    fig = go.Figure(go.Heatmap(
+        z=pivot.to_numpy(dtype=float), x=x, y=y,
+        colorscale='RdYlGn_r', colorbar=dict(title=value),
+        hovertemplate=f"%{{x}}<br>%{{y}}<br>{value}: %{{z:.2f}}<extra></extra>"
+    ))
+    fig.update_layout(title=title, xaxis=dict(type='category'), yaxis=dict(type='category'))
+    return fig
+
+
+def _filter_buttons(fig, all_title, title_fmt, names=None):
+    names = [trace.name for trace in fig.data] if names is None else names
+    buttons = [dict(
+        label="All",
+        method="update",
+        args=[{"visible": [True] * len(fig.data)},
+              {"title": all_title}]
+    )]
+    for name in names:
+        visible = [trace.name == str(name) for trace in fig.data]
+        buttons.append(dict(
+            label=str(name),
+            method="update",
+            args=[{"visible": visible},
+                  {"title": title_fmt.format(name)}]
+        ))
+    return buttons
+
+
+# ---------------------------------------
+# Visualizations (theme-free)
+# ---------------------------------------
+def _vis1(factory):
+    fig = px.line(
+        factory.mean(['Year', 'Group']),
+        x='Year', y='Inflation (%)', color='Group', markers=True,
+        title='Average Inflation Rate by Group'
+    )
+    fig.update_traces(line=dict(width=2), marker=dict(size=8))
+    buttons = _filter_buttons(fig, "Average Inflation Rate for All Groups",
+                              "Average Inflation Rate for Group: {}")
+    fig.update_layout(
+        xaxis_title='Year', yaxis_title='Average Inflation (%)',
+        hovermode='x unified',
+        updatemenus=[dict(
+            active=0, buttons=buttons, x=1.35, y=1.10,
+            xanchor='right', yanchor='top'
+        )]
+    )
+    return fig
+
+
+def _vis2(factory, heatmap=False):
+    if heatmap:
+        pivot = factory.mean(['Year', 'Group']).pivot(index='Year', columns='Group',
+                                                      values='Inflation (%)')
+        fig = _heatmap(pivot, pivot.columns.to_numpy(), pivot.index.astype(str).to_numpy(),
+                       'Average Inflation Rate by Years')
+        fig.update_layout(xaxis_title='Group', yaxis_title='Year')
+        return fig
+    fig = px.line(
+        factory.mean(['Year', 'Group']),
+        x='Group', y='Inflation (%)', color='Year', markers=True,
+        title='Average Inflation Rate by Years'
+    )
+    fig.update_traces(line=dict(width=2), marker=dict(size=8))
+    buttons = _filter_buttons(fig, "Average Inflation Rate by Group for All Years",
+                              "Average Inflation Rate by Group for Year: {}")
+    fig.update_layout(
+        hovermode='x unified',
+        updatemenus=[dict(
+            active=0, buttons=buttons, x=1.35, y=1.10,
+            xanchor='right', yanchor='top'
+        )]
+    )
+    return fig
+
+
+def _vis3(factory, group=None, sector=None):
+    panel = factory.panel('State')
+    rows = panel.observed
+    title = 'Average Inflation Rate by States'
+    where = tuple((dim, value) for dim, value in (('Group', group), ('Sector', sector)) if value)
+    if where:
+        # Filtered onto the unfiltered grid: same traces and axis, new values
+        panel = factory.panel('State', where=where).reindex(panel.periods, panel.series)
+        title += ' (' + ', '.join(f"{dim}: {value}" for dim, value in where) + ')'
+    fig = go.Figure(_panel_traces(
+        panel, panel.mean()[rows], period_labels(panel.periods[rows]), connectgaps=True,
+        line=dict(width=2), marker=dict(size=8)
+    ))
+    buttons = _filter_buttons(fig, "Average Inflation Rate for all States",
+                              "Average Inflation Rate for State: {}")
+    fig.update_layout(
+        title=title,
+        xaxis=dict(_period_axis(panel.periods[rows]), title='Month_Year'),
+        yaxis_title='Inflation (%)', legend_title_text='State',
+        hovermode='x unified',
+        updatemenus=[dict(
+            active=0, buttons=buttons, x=1.35, y=1.10,
+            xanchor='right', yanchor='top'
+        )]
+    )
+    return fig
+
+
+def _vis4(factory, heatmap=False, group=None, sector=None):
+    means = factory.mean(['Period', 'State'])
+    title = 'Average Inflation Rate for Months and Year'
+    where = tuple((dim, value) for dim, value in (('Group', group), ('Sector', sector)) if value)
+    if where:
+        # Filtered values on the unfiltered (month, state) cells, so the
+        # traces and axes stay those of the unfiltered figure
+        values = factory.panel('State', where=where).lookup(means['Period'], means['State'])
+        means = means.assign(**{'Inflation (%)': values})
+        title += ' (' + ', '.join(f"{dim}: {value}" for dim, value in where) + ')'
+    if heatmap:
+        pivot = means.pivot(index='Period', columns='State', values='Inflation (%)')
+        fig = _heatmap(pivot, pivot.columns.to_numpy(), period_labels(pivot.index), title)
+        fig.update_layout(xaxis_title='State', yaxis_title='Month_Year')
+        return fig
+    fig = px.line(
+        _with_month_year(means),
+        x='State', y='Inflation (%)', color='Month_Year', markers=True,
+        title=title
+    )
+    fig.update_traces(line=dict(width=2), marker=dict(size=8))
+    buttons = _filter_buttons(fig, "Average Inflation Rate for all months and Years",
+                              "Average Inflation Rate for month and Year: {}")
+    fig.update_layout(
+        hovermode='x unified',
+        updatemenus=[dict(
+            active=0, buttons=buttons, x=1.35, y=1.10,
+            xanchor='right', yanchor='top'
+        )]
+    )
+    return fig
+
+
+def _vis5(factory, heatmap=False):
+    medians = factory.median(['Month_Num', 'Year'])
+    if heatmap:
+        pivot = medians.pivot(index='Year', columns='Month_Num', values='Inflation (%)')
+        fig = _heatmap(pivot, np.asarray(MONTHS)[pivot.columns], pivot.index.astype(str).to_numpy(),
+                       'Median Inflation by Month Across Years')
+        fig.update_layout(xaxis_title='Month', yaxis_title='Year')
+        return fig
+    by_month = dict(tuple(medians.groupby('Month_Num')))
+    traces = []
+    for i, month in enumerate(MONTHS):
+        month_grouped = by_month.get(i)
+        if month_grouped is not None:
+            trace = go.Bar(
+                x=month_grouped['Year'], y=month_grouped['Inflation (%)'],
+                name=month,
+                marker=dict(color='rgb(150, 95, 100)', line=dict(width=1)),
+                visible=False
+            )
+        else:
+            trace = go.Bar(x=[], y=[], name=month, visible=False)
+        traces.append(trace)
+    traces[0]['visible'] = True
+    buttons = []
+    for i, month in enumerate(MONTHS):
+        visibility = [False] * len(MONTHS)
+        visibility[i] = True
+        buttons.append(dict(
+            label=month,
+            method="update",
+            args=[{"visible": visibility},
+                  {"title": f"Average Inflation in {month} Across Years"}],
+        ))
+    layout = go.Layout(
+        updatemenus=[dict(
+            active=0, buttons=buttons, x=0.05, y=1.15,
+            xanchor='left', yanchor='top'
+        )],
+        title=f"Average Inflation in {MONTHS[0]} Across Years",
+        xaxis=dict(title="Year", tickmode='linear', dtick=1),
+        yaxis=dict(title="Average Inflation (%)"),
+        hovermode='x unified'
+    )
+    return go.Figure(data=traces, layout=layout)
+
+
+def _vis6(factory, period=None):
+    contrib = factory.median(['Period', 'Group'])
+    fig = make_subplots(
+        rows=1, cols=2, specs=[[{'type': 'domain'}, {'type': 'xy'}]],
+        subplot_titles=("Contribution Pie Chart", "Contribution Stacked Bar Chart"),
+        horizontal_spacing=0.30
+    )
+    colors = px.colors.qualitative.Set3
+    if period is not None:
+        # One month only, with a bar for every Group (empty when the month has
+        # none) so each month has the same traces and differs only in values
+        month = contrib[contrib['Period'] == period]
+        values = month.set_index('Group')['Inflation (%)']
+        label = period_labels([period])[0]
+        fig.add_trace(go.Pie(labels=month['Group'], values=month['Inflation (%)'],
+                             textinfo='percent+label', name=label), row=1, col=1)
+        for j, grp in enumerate(np.sort(contrib['Group'].unique())):
+            fig.add_trace(go.Bar(
+                x=['Inflation Contribution'], y=[values.get(grp)], name=grp,
+                legendgroup=grp, marker_color=colors[j % len(colors)]
+            ), row=1, col=2)
+        fig.update_layout(barmode='stack', title=f"Contribution Analysis for {label}",
+                          xaxis_title="", yaxis_title="Average Inflation (%)",
+                          legend_title="Group")
+        return fig
+    by_month = dict(tuple(contrib.groupby('Period')))
+    unique_months = list(by_month)
+    trace_indices = []
+    total_traces = 0
+    labels = []
+    for month, label in zip(unique_months, period_labels(unique_months)):
+        labels.append(label)
+        group_contrib = by_month[month]
+        fig.add_trace(go.Pie(
+            labels=group_contrib['Group'],
+            values=group_contrib['Inflation (%)'],
+            textinfo='percent+label',
+            name=label
+        ), row=1, col=1)
+        current_indices = [total_traces]
+        total_traces += 1
+        for j, (grp, value) in enumerate(zip(group_contrib['Group'], group_contrib['Inflation (%)'])):
+            fig.add_trace(go.Bar(
+                x=['Inflation Contribution'], y=[value], name=grp,
+                legendgroup=grp, marker_color=colors[j % len(colors)]
+            ), row=1, col=2)
+            current_indices.append(total_traces)
+            total_traces += 1
+        trace_indices.append(current_indices)
+    buttons = []
+    for i, label in enumerate(labels):
+        vis = [False] * total_traces
+        for idx in trace_indices[i]:
+            vis[idx] = True
+        buttons.append(dict(
+            label=label,
+            method="update",
+            args=[{"visible": vis},
+                  {"title": f"Contribution Analysis for {label}"}]
+        ))
+    fig.update_layout(
+        barmode='stack',
+        updatemenus=[dict(
+            active=0, buttons=buttons, x=0.5, y=1.2,
+            xanchor='center', yanchor='top'
+        )],
+        title=f"Contribution Analysis for {labels[0]}" if labels else "Contribution Analysis",
+        xaxis_title="",
+        yaxis_title="Average Inflation (%)",
+        legend_title="Group"
+    )
+    return fig
+
+
+def _vis7_hist(factory):
+    # Bins are computed server-side; the figure only carries the counts
+    hist = factory.histogram('Index', 'Group')
+    fig = px.bar(
+        hist, x='center', y='count', color='Group',
+        facet_col='Group', facet_col_wrap=3,
+        title='Distribution of Index Values by Group',
+        labels={'center': 'Index Value'},
+        color_discrete_sequence=px.colors.qualitative.Plotly
+    )
+    if not hist.empty:
+        bin_width = hist['right'].iloc[0] - hist['left'].iloc[0]
+        fig.update_traces(width=0.9 * bin_width, marker_line_width=0)
+    return fig
+
+
+def _vis7_box(factory):
+    # Quartiles, whiskers and a capped outlier sample instead of raw values
+    stats, outliers = factory.box('Index', 'Group')
+    colors = px.colors.qualitative.Plotly
+    fig = go.Figure()
+    for i, row in enumerate(stats.itertuples(index=False)):
+        color = colors[i % len(colors)]
+        fig.add_trace(go.Box(
+            x=[row.Group], q1=[row.q1], median=[row.median], q3=[row.q3],
+            lowerfence=[row.lowerfence], upperfence=[row.upperfence],
+            name=row.Group, legendgroup=row.Group, marker_color=color
+        ))
+        points = outliers[outliers['Group'] == row.Group]
+        if not points.empty:
+            fig.add_trace(go.Scatter(
+                x=points['Group'], y=points['Index'], mode='markers',
+                name=row.Group, legendgroup=row.Group, showlegend=False,
+                marker=dict(color=color, size=4)
+            ))
+    fig.update_layout(
+        title='Box Plot of Index Values by Group',
+        xaxis_title='Group', yaxis_title='Index Value'
+    )
+    return fig
+
+
+def _vis8(factory):
+    rows, y_title = factory.frame(['Date', 'Inflation (%)']), 'Inflation (%)'
+    if rows is None:
+        # Rollups and databases hold no rows: one point per month (the
+        # average of that month's rows) stands in for them
+        monthly = factory.mean(['Period'])
+        rows = monthly.assign(Date=period_dates(monthly['Period']))
+        y_title = 'Average Inflation (%)'
+    fig = px.line(
+        rows, x='Date', y='Inflation (%)',
+        title='Dynamic Time Window Analysis of Inflation'
+    )
+    fig.update_traces(line=dict(width=2), marker=dict(size=8))
+    fig.update_layout(
+        xaxis_title='Date', yaxis_title=y_title,
+        xaxis=dict(
+            showgrid=False,
+            rangeselector=dict(
+                buttons=[
+                    dict(count=1, label="1m", step="month", stepmode="backward"),
+                    dict(count=3, label="3m", step="month", stepmode="backward"),
+                    dict(count=6, label="6m", step="month", stepmode="backward"),
+                    dict(count=1, label="YTD", step="year", stepmode="todate"),
+                    dict(count=1, label="1y", step="year", stepmode="backward"),
+                    dict(step="all")
+                ]
+            ),
+            rangeslider=dict(visible=True),
+            type="date"
+        ),
+        hovermode='x unified'
+    )
+    return fig
+
+
+def _vis9(factory, grain='Year'):
+    # Only the active grain is shipped; switching grains asks the server for
+    # the (cached) aggregate of the other grain instead of carrying every
+    # grain's arrays in the dropdown buttons.
+    label = grain
+    key = GRAINS[grain]
+    to_labels = KEY_LABELS.get(key)
+    panel = factory.panel('Sector')
+    if key != panel.key:
+        panel = panel.rollup(key)
+    rows = panel.observed
+    sectors = factory.labels('Sector')
+    keys = panel.periods[rows]
+    fig = go.Figure(_panel_traces(
+        panel, panel.mean()[rows], to_labels(keys) if to_labels else keys, series=sectors,
+        line=dict(width=2), marker=dict(size=8)
+    ))
+    sector_buttons = [dict(
+        label="All",
+        method="update",
+        args=[{"visible": [True] * len(sectors)},
+              {"title": f"Average Inflation Rate by {label} for All Sectors"}]
+    )]
+    for i, sec in enumerate(sectors):
+        vis = [False] * len(sectors)
+        vis[i] = True
+        sector_buttons.append(dict(
+            label=sec,
+            method="update",
+            args=[{"visible": vis},
+                  {"title": f"Average Inflation Rate by {label} for Sector: {sec}"}]
+        ))
+    fig.update_layout(
+        title=f"Average Inflation Rate by {label} for Sectors",
+        xaxis=dict(title=label, type='category') if to_labels else dict(title=label),
+        hovermode='x unified',
+        updatemenus=[
+            dict(
+                buttons=sector_buttons, direction="down",
+                pad={"r": 10, "t": 10}, showactive=True,
+                x=0.1, y=1.15, xanchor="left", yanchor="top", active=0,
+                name="Sector"
+            )
+        ]
+    )
+    return fig
+
+
+def _vis10(factory):
+    fig = px.bar(
+        factory.mean(['Group', 'Sector']),
+        x='Group', y='Inflation (%)', color='Sector', barmode='group',
+        title='Aggregated Inflation by Group and Sector'
+    )
+    fig.update_traces(marker_line=dict(width=1))
+    fig.update_layout(hovermode='x unified')
+    return fig
+
+
+def _vis11(factory):
+    panel = factory.panel('Sector')
+    rows = panel.observed
+    window = 5
+    moving_std = panel.rolling_std(window, min_periods=1)[rows]
+    fig = go.Figure(_panel_traces(
+        panel, moving_std, period_labels(panel.periods[rows]),
+        line=dict(width=2), marker=dict(size=8)
+    ))
+    buttons = _filter_buttons(fig, "Moving Standard Deviation of Inflation Rate by Sector: All",
+                              "Moving Standard Deviation of Inflation Rate for Sector: {}",
+                              names=panel.series)
+    fig.update_layout(
+        title='Moving Standard Deviation of Inflation Rate by Sector',
+        xaxis=dict(_period_axis(panel.periods[rows]), title='Month_Year'),
+        yaxis_title='moving_std', legend_title_text='Sector',
+        hovermode='x unified',
+        updatemenus=[dict(
+            active=0, buttons=buttons, x=1.15, y=1.15,
+            xanchor="right", yanchor="top"
+        )]
+    )
+    return fig
+
+
+def _vis12(factory):
+    panel = factory.panel('Group')
+    volatility_data = pd.DataFrame({'Group': panel.series, 'Overall Volatility': panel.std()})
+    fig = px.bar(
+        volatility_data, x='Group', y='Overall Volatility', color='Group',
+        title='Overall Inflation Volatility by Group',
+        color_discrete_sequence=px.colors.qualitative.Plotly
+    )
+    fig.update_traces(marker_line=dict(width=1))
+    fig.update_layout(hovermode='x unified')
+    return fig
+
+
+BUILDERS = {
+    'vis1': _vis1,
+    'vis2': _vis2,
+    'vis3': _vis3,
+    'vis4': _vis4,
+    'vis5': _vis5,
+    'vis6': _vis6,
+    'vis7_hist': _vis7_hist,
+    'vis7_box': _vis7_box,
+    'vis8': _vis8,
+    'vis9': _vis9,
+    'vis10': _vis10,
+    'vis11': _vis11,
+    'vis12': _vis12,
+}
+
+# Aggregates the builders ask the factory for, so they can be precomputed
+# out of core (see cpi_partition): (keys, how) rollups and Period x by panels
+ROLLUPS = [
+    (('Period',), 'mean'),
+    (('Year', 'Group'), 'mean'),
+    (('Period', 'State'), 'mean'),
+    (('Group', 'Sector'), 'mean'),
+    (('Month_Num', 'Year'), 'median'),
+    (('Period', 'Group'), 'median'),
+]
+PANELS = ['State', 'Sector', 'Group']
+# (value, by) of the distribution views (Vis 7)
+DISTRIBUTIONS = [('Index', 'Group')]
+
+# Views that also render as a single-trace heatmap (builder param heatmap=True)
+HEATMAP_VIEWS = ['vis2', 'vis4', 'vis5']
+
+# Value column each figure is built from (default 'Inflation (%)'); a release
+# diff that leaves it untouched lets the previous release's figure be reused
+FIGURE_VALUES = {'vis7_hist': 'Index', 'vis7_box': 'Index'}
+
+# Trace properties that change with a view's parameters (Vis 3 and Vis 4
+# filters, the Vis 6 month), optionally per trace type; for each parameter
+# choice the traces are otherwise identical
+PATCH_FIELDS = {
+    'vis3': ['y'],
+    'vis4': {'scatter': ['y'], 'heatmap': ['z']},
+    'vis6': ['labels', 'values', 'name', 'y'],
+}
+
+
+def figure_patch(spec, fields):
+    """``(path, value)`` updates turning another figure of the same view into ``spec``.
+
+    Only the trace ``fields`` (a list, or a dict of lists by trace type)
+    and the title are included, so a client can apply them (e.g. as a
+    ``dash.Patch``) instead of receiving the layout, every trace and the
+    menus again.
+    """
+    def trace_fields(trace):
+        return fields.get(trace.get('type'), []) if isinstance(fields, dict) else fields
+
+    updates = [(('data', i, field), trace[field]) for i, trace in enumerate(spec['data'])
+               for field in trace_fields(trace) if field in trace]
+    updates.append((('layout', 'title', 'text'), spec['layout'].get('title', {}).get('text')))
+    return updates
+
+
+# ---------------------------------------
+# Release revisions
+# ---------------------------------------
+def revisions_spec(diff):
+    """Theme-free stacked bar of added/removed/revised rows per month."""
+    counts = diff.revisions.groupby(['Period', 'change']).size().unstack(fill_value=0)
+    labels = period_labels(counts.index)
+    fig = go.Figure([
+        go.Bar(x=labels, y=counts[change].to_numpy(), name=change.capitalize())
+        for change in counts.columns
+    ])
+    totals = diff.counts()
+    fig.update_layout(
+        title=("No changes between the releases" if diff.empty else
+               "Revisions by Month: {added} added, {removed} removed, {revised} revised".format(**totals)),
+        barmode='stack', xaxis=dict(_period_axis(counts.index), title='Month_Year'),
+        yaxis_title='Rows', hovermode='x unified'
+    )
+    spec = fig.to_dict()
+    spec['layout'].pop('template', None)
+    return spec
+
+
+# ---------------------------------------
+# Cross-filter tables
+# ---------------------------------------
+# Sum/count marginals shipped for the views filtered in the browser, one per
+# table: the view's own x and series dims plus the dims a selection can
+# filter it by.  Vis 1 and 2 share 'year', Vis 10 uses 'sector'; Vis 3 and
+# Vis 4 are filtered on the server.
+CROSSFILTER_TABLES = {
+    'year': ['Year', 'Group', 'State', 'Sector'],
+    'sector': ['Group', 'Sector', 'State'],
+}
+
+
+def crossfilter_table(totals):
+    """Compact sum/count tables the browser re-aggregates when cross-filtering.
+
+    ``totals`` maps each :data:`CROSSFILTER_TABLES` name to a frame of its
+    dims plus ``sum`` and ``count`` columns.  The labels of every dim are
+    shipped once and each table row carries one integer code per dim, so
+    the mean behind a view's (x, series) cells can be rebuilt client-side
+    for any State/Group/Sector selection.
+    """
+    labels = {}
+    for name, frame in totals.items():
+        for dim in CROSSFILTER_TABLES[name]:
+            values = frame[dim].dropna().unique()
+            labels[dim] = np.unique(np.concatenate([labels[dim], values]) if dim in labels else values)
+    tables = {}
+    for name, frame in totals.items():
+        tables[name] = dict(
+            codes={dim: pd.Categorical(frame[dim], categories=labels[dim]).codes.tolist()
+                   for dim in CROSSFILTER_TABLES[name]},
+            sum=frame['sum'].to_numpy(dtype=float).round(6).tolist(),
+            count=frame['count'].to_numpy(dtype=np.int64).tolist(),
+        )
+    return dict(dims={dim: [str(v) for v in ordered] for dim, ordered in labels.items()},
+                tables=tables)
+
+
+# ---------------------------------------
+# Figure factory
+# ---------------------------------------
+class FigureFactory:
+    """Builds each figure once per dataset and themes it at serve time.
+
+    Shared aggregates (e.g. the Year x Group mean behind Vis 1 and Vis 2)
+    are computed once and reused by every figure that needs them.  By
+    default they live on the factory; pass a shared ``cache`` (anything with
+    dict-style ``get`` and item assignment, such as
+    :class:`cpi_cache.DatasetCache`) and a dataset ``version`` to share them
+    across factories and sessions.  Aggregates and panels found in
+    ``rollups`` (a :class:`cpi_partition.Rollups`) are taken from there
+    instead of being computed from ``data``.  A :class:`cpi_sql.SQLStore`
+    as ``rollups`` answers everything in SQL, and ``data`` may be None.
+
+    Given the factory of the ``previous`` release and the
+    :class:`cpi_diff.ReleaseDiff` from it, only the groups a revision
+    touches are re-aggregated and figures whose value column did not change
+    are taken over as they are; results the previous factory has not cached
+    are built from ``data`` as usual.
+    """
+
+    def __init__(self, data, cache=None, version=None, rollups=None, previous=None, diff=None):
+        self.data = data
+        self.version = version
+        self.rollups = rollups
+        self.previous = previous if diff is not None else None
+        self.diff = diff
+        self._cache = {} if cache is None else cache
+
+    def _keys(self, frame, keys):
+        return [DERIVED_KEYS[key](frame).rename(key) if key in DERIVED_KEYS else frame[key]
+                for key in keys]
+
+    def _group(self, data, keys, how, value):
+        grouped = data.groupby(self._keys(data, keys))[value]
+        return getattr(grouped, how)().reset_index()
+
+    def _revise(self, old, keys, how, value):
+        # Replace the groups the diff touches in the previous release's result
+        touched = self.diff.touched(value)
+        if touched.empty:
+            return old
+        stale = pd.MultiIndex.from_arrays(self._keys(touched, keys)).unique()
+        keep = ~pd.MultiIndex.from_frame(old[list(keys)]).isin(stale)
+        rows = pd.MultiIndex.from_arrays(self._keys(self.data, keys)).isin(stale)
+        fresh = self._group(self.data[rows], keys, how, value)
+        return pd.concat([old[keep], fresh], ignore_index=True).sort_values(
+            list(keys), ignore_index=True
+        )
+
+    def _previous(self, key):
+        # The previous release's cached result for ``key``, or None; one it
+        # has not built yet is built fresh here rather than there
+        if self.previous is None:
+            return None
+        return self.previous._cache.get((self.previous.version,) + key)
+
+    def _aggregate(self, keys, how, value):
+        key = ('aggregate', tuple(keys), how, value)
+        cache_key = (self.version,) + key
+        result = self._cache.get(cache_key)
+        if result is None:
+            if self.rollups is not None:
+                result = self.rollups.get(keys, how, value)
+            if result is None and self.data is not None:
+                old = self._previous(key)
+                if old is not None:
+                    result = self._revise(old, keys, how, value)
+            if result is None:
+                result = self._group(self.data, keys, how, value)
+            self._cache[cache_key] = result
+        return result
+
+    def mean(self, keys, value='Inflation (%)'):
+        return self._aggregate(keys, 'mean', value)
+
+    def median(self, keys, value='Inflation (%)'):
+        return self._aggregate(keys, 'median', value)
+
+    def panel(self, by, value='Inflation (%)', where=()):
+        """Dense Period x ``by`` :class:`cpi_panel.Panel` of ``value``.
+
+        ``where`` is a tuple of ``(column, value)`` pairs restricting the
+        rows; each selection is cached separately.
+        """
+        cache_key = (self.version, 'panel', by, value) + tuple(where)
+        result = self._cache.get(cache_key)
+        if result is None and self.rollups is not None:
+            result = self.rollups.panel(by, value, where)
+            if result is not None:
+                self._cache[cache_key] = result
+        if (result is None and not where and self.previous is not None
+                and self.diff.touched(value).empty):
+            result = self._previous(('panel', by, value))
+        if result is None:
+            data = self.data
+            if where:
+                data = data[np.logical_and.reduce([data[column].to_numpy() == selected
+                                                   for column, selected in where])]
+            result = Panel.from_frame(data, by, value)
+            self._cache[cache_key] = result
+        return result
+
+    def _pushed(self, name, *args):
+        # Result of a rollups backend that computes ``name`` itself, else None
+        method = getattr(self.rollups, name, None)
+        return None if method is None else method(*args)
+
+    def _cached(self, key, compute):
+        cache_key = (self.version,) + key
+        result = self._cache.get(cache_key)
+        if result is None:
+            result = self._cache[cache_key] = compute()
+        return result
+
+    def histogram(self, value='Index', by='Group'):
+        """:func:`cpi_stats.histogram_summary` of ``value`` per ``by``."""
+        def compute():
+            result = self._pushed('histogram', value, by)
+            return histogram_summary(self.data, value=value, by=by) if result is None else result
+        return self._cached(('histogram', value, by), compute)
+
+    def box(self, value='Index', by='Group'):
+        """:func:`cpi_stats.box_summary` of ``value`` per ``by``."""
+        def compute():
+            result = self._pushed('box', value, by)
+            return box_summary(self.data, value=value, by=by) if result is None else result
+        return self._cached(('box', value, by), compute)
+
+    def labels(self, column):
+        """Distinct values of ``column`` in order of appearance."""
+        def compute():
+            result = self._pushed('labels', column)
+            return self.data[column].dropna().unique() if result is None else result
+        return self._cached(('labels', column), compute)
+
+    def frame(self, columns):
+        """``columns`` of every row, for the views that plot rows (None without ``data``)."""
+        def compute():
+            return None if self.data is None else self.data[columns]
+        return self._cached(('frame', tuple(columns)), compute)
+
+    def prepare(self):
+        """Compute everything the builders read from the data and return ``self``.
+
+        Afterwards every figure can be built from the cache alone, e.g. by a
+        factory with ``data=None`` in another process sharing a copy of it.
+        """
+        for keys, how in ROLLUPS:
+            self._aggregate(keys, how, 'Inflation (%)')
+        for by in PANELS:
+            self.panel(by)
+        for value, by in DISTRIBUTIONS:
+            self.histogram(value, by)
+            self.box(value, by)
+        self.labels('Sector')
+        self.frame(['Date', 'Inflation (%)'])
+        return self
+
+    def crossfilter(self, value='Inflation (%)'):
+        """:func:`crossfilter_table` of ``value`` over :data:`CROSSFILTER_TABLES`."""
+        totals = {}
+        for name, dims in CROSSFILTER_TABLES.items():
+            result = self._pushed('crossfilter', value, dims)
+            if result is None:
+                grouped = self.data.groupby(dims, sort=False)[value]
+                result = grouped.agg(['sum', 'count']).reset_index()
+            totals[name] = result.sort_values(dims, ignore_index=True)
+        return crossfilter_table(totals)
+
+    def spec(self, name, **params):
+        """Theme-free figure dict for ``name``, built on first use.
+
+        ``params`` are passed to the builder (e.g. ``grain`` for Vis 9) and
+        each combination is cached separately.
+        """
+        key = ('spec', name) + tuple(sorted(params.items()))
+        cache_key = (self.version,) + key
+        spec = self._cache.get(cache_key)
+        if spec is None and self.previous is not None:
+            if self.diff.touched(FIGURE_VALUES.get(name, 'Inflation (%)')).empty:
+                spec = self._previous(key)
+        if spec is None:
+            spec = BUILDERS[name](self, **params).to_dict()
+            spec['layout'].pop('template', None)
+            self._cache[cache_key] = spec
+        return spec
+
+    def figure(self, name, theme='light', **params):
+        """Figure dict for ``name`` with ``theme`` applied."""
+        return apply_theme(self.spec(name, **params), theme)
@@ -0,0 +1,69 @@
+"""HTTP caching for the Dash server.
+
+The index page, ``/_dash-layout`` and ``/_dash-dependencies`` only change
+when the dataset (or the app itself) does, so they carry an ETag made of
+the dataset version plus a digest of the body and ``Cache-Control:
+no-cache``: browsers keep them and revalidate, and a matching
+``If-None-Match`` is answered with an empty 304 before Dash serializes the
+layout again.  Fingerprinted component suites and cache-busted assets
+(``?m=<mtime>``) are marked immutable for a year.  Routes serving data of
+their own (such as a dataset page's figures) answer with
+:func:`revalidated` the same way.
+"""
+import hashlib
+
+from flask import current_app, request
+
+LONG_LIVED = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+
+def body_etag(version, body):
+    """ETag of ``body`` served for dataset ``version``."""
+    return f"{version[:16]}-{hashlib.sha256(body).hexdigest()[:16]}"
+
+
+def revalidated(etag, body, mimetype='application/json'):
+    """Response with ``body`` under ``etag``, or an empty 304 if the client has it."""
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(body, mimetype=mimetype)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = REVALIDATE
+    return response
+
+
+def install_http_caching(app, version, paths=('', '_dash-layout', '_dash-dependencies')):
+    """Add ETag/304 handling and long-lived asset headers to ``app.server``."""
+    server = app.server
+    prefix = app.config.routes_pathname_prefix
+    cacheable = {prefix + path for path in paths}
+    static = (prefix + '_dash-component-suites/', prefix + 'assets/')
+    # path -> ETag of its (static) body, learned from the first response
+    etags = {}
+
+    @server.before_request
+    def _answer_not_modified():
+        etag = etags.get(request.path)
+        if etag and request.method == 'GET' and request.if_none_match.contains(etag):
+            response = server.response_class(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = REVALIDATE
+            return response
+        return None
+
+    @server.after_request
+    def _add_cache_headers(response):
+        path = request.path
+        if request.method != 'GET' or response.status_code != 200:
+            return response
+        if path in cacheable:
+            etag = etags.get(path)
+            if etag is None:
+                etag = etags[path] = body_etag(version, response.get_data())
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = REVALIDATE
+        elif path.startswith(static) and (response.cache_control.max_age or 'm' in request.args):
+            response.headers['Cache-Control'] = LONG_LIVED
+        return response
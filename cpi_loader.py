@@ -0,0 +1,175 @@
+"""Dataset loading shared by both apps.
+
+A dataset can be a single CSV (path or uploaded file object), a directory
+of CSVs, a glob pattern, or a list of any of those.  Multiple files are
+parsed and cleaned in parallel, then concatenated; when releases overlap,
+the file that sorts last wins for the months they share.
+"""
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Columns identifying one observation; used to drop months repeated across files
+KEY_COLUMNS = ['Sector', 'Period', 'State', 'Group']
+
+MONTH_ABBR = np.array(['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+                       'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'])
+
+
+def period_key(year, month):
+    """Integer period key ``year * 12 + (month - 1)`` for 1-based ``month``.
+
+    Keys sort chronologically and ``divmod(key, 12)`` gives back
+    ``(year, month - 1)``.
+    """
+    return year * 12 + (month - 1)
+
+
+def period_labels(periods):
+    """Render period keys as '%b %y' labels (e.g. 'Jan 23')."""
+    periods = np.asarray(periods, dtype=np.int64)
+    unique, inverse = np.unique(periods, return_inverse=True)
+    labels = np.array([f"{MONTH_ABBR[p % 12]} {p // 12 % 100:02d}" for p in unique.tolist()],
+                      dtype=object)
+    return labels[inverse.ravel()]
+
+
+def period_dates(periods):
+    """First day of each period key's month as ``datetime64[ns]``."""
+    periods = np.asarray(periods, dtype=np.int64)
+    return (periods - 1970 * 12).astype('datetime64[M]').astype('datetime64[ns]')
+
+
+MONTH_NAMES = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+               'August', 'September', 'October', 'November', 'December']
+
+# Lower-cased month name or abbreviation -> month number
+MONTH_NUMBERS = {name.lower(): i + 1 for i, name in enumerate(MONTH_NAMES)}
+MONTH_NUMBERS.update({abbr.lower(): i + 1 for i, abbr in enumerate(MONTH_ABBR)})
+MONTH_NUMBERS['sept'] = 9
+
+NUMERIC_COLUMNS = ['Index', 'Inflation (%)']
+
+REPORT_COLUMNS = ['reason', 'rows', 'examples']
+
+
+def _month_numbers(months):
+    # Look up each distinct month label once instead of parsing every row
+    codes, uniques = pd.factorize(months)
+    lookup = np.array([MONTH_NUMBERS.get(str(u).strip().lower(), 0) for u in uniques] + [0])
+    return lookup[codes]
+
+
+def clean_data(data):
+    """Validate and coerce ``data`` in one vectorized pass.
+
+    Returns ``(clean, report)``.  ``clean`` holds the valid rows with numeric
+    ``Index``/``Inflation (%)``, an integer ``Year``, the ``Period`` key and
+    ``Date``, in chronological order.  ``report`` has one row per rejection
+    reason with the number of rows it hit and a few example row labels.
+    """
+    reasons = {}
+    year = pd.to_numeric(data['Year'], errors='coerce').to_numpy(dtype=float)
+    reasons['invalid Year'] = np.isnan(year) | (year != np.round(year))
+    month = _month_numbers(data['Month'])
+    reasons['invalid Month'] = month == 0
+
+    numeric = {}
+    for column in NUMERIC_COLUMNS:
+        missing = data[column].isna().to_numpy()
+        numeric[column] = pd.to_numeric(data[column], errors='coerce').to_numpy(dtype=float)
+        reasons[f'missing {column}'] = missing
+        reasons[f'non-numeric {column}'] = np.isnan(numeric[column]) & ~missing
+    for column in data.columns.difference(['Year', 'Month'] + NUMERIC_COLUMNS, sort=False):
+        reasons[f'missing {column}'] = data[column].isna().to_numpy()
+
+    rejected = np.logical_or.reduce(list(reasons.values()))
+    rows = np.flatnonzero(~rejected)
+    period = period_key(np.nan_to_num(year).astype(np.int64), month)[rows]
+    # Exports are usually already in date order; only sort when they aren't
+    if period.size and not np.all(period[1:] >= period[:-1]):
+        order = np.argsort(period, kind='stable')
+        rows, period = rows[order], period[order]
+
+    columns = {column: data[column].to_numpy()[rows] for column in data.columns}
+    columns['Year'] = year[rows].astype(np.int64)
+    for column in NUMERIC_COLUMNS:
+        columns[column] = numeric[column][rows]
+    columns['Date'] = period_dates(period)
+    columns['Period'] = period.astype(np.int32)
+    clean = pd.DataFrame(columns, index=data.index[rows])
+
+    report = pd.DataFrame(
+        [(reason, int(mask.sum()), data.index[mask][:5].tolist())
+         for reason, mask in reasons.items() if mask.any()],
+        columns=REPORT_COLUMNS
+    )
+    return clean, report
+
+
+def combine_reports(reports):
+    """One row per reason from the :func:`clean_data` reports of a file's chunks."""
+    if not reports:
+        return pd.DataFrame(columns=REPORT_COLUMNS)
+    report = pd.concat(reports, ignore_index=True)
+    return pd.DataFrame(
+        [(reason, int(group['rows'].sum()),
+          [label for labels in group['examples'] for label in labels][:5])
+         for reason, group in report.groupby('reason', sort=False)],
+        columns=REPORT_COLUMNS
+    )
+
+
+def _read_clean(source):
+    clean, report = clean_data(pd.read_csv(source))
+    report.insert(0, 'file', str(getattr(source, 'name', source)))
+    return clean, report
+
+
+def resolve_sources(source):
+    """Expand ``source`` into an ordered list of files or file objects."""
+    if isinstance(source, (list, tuple)):
+        return [item for entry in source for item in resolve_sources(entry)]
+    if not isinstance(source, (str, os.PathLike)):
+        return [source]
+    path = os.fspath(source)
+    if os.path.isdir(path):
+        files = sorted(glob.glob(os.path.join(path, '*.csv')))
+    elif glob.has_magic(path):
+        files = sorted(glob.glob(path))
+    else:
+        files = [path]
+    if not files:
+        raise FileNotFoundError(f"No CSV files found for {path!r}")
+    return files
+
+
+def load_dataset(source, workers=None, processes=False, with_report=False):
+    """Load and clean every file in ``source`` into one frame.
+
+    Files are parsed in a thread pool by default; ``processes=True`` uses a
+    process pool instead, which only applies when every source is a path.
+    With ``with_report=True`` returns ``(data, report)``, where ``report``
+    lists the rejected rows per file and reason (see :func:`clean_data`).
+    """
+    sources = resolve_sources(source)
+    if len(sources) == 1:
+        data, report = _read_clean(sources[0])
+    else:
+        use_processes = processes and all(isinstance(s, str) for s in sources)
+        pool_cls = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        with pool_cls(max_workers=min(len(sources), workers or os.cpu_count() or 1)) as pool:
+            results = list(pool.map(_read_clean, sources))
+
+        data = pd.concat([frame for frame, _ in results], ignore_index=True, copy=False)
+        report = pd.concat([rep for _, rep in results], ignore_index=True)
+    # Keys are unique within the result (a later row, e.g. from a later
+    # release, wins), which is what cpi_diff.diff_releases relies on
+    keys = [column for column in KEY_COLUMNS if column in data.columns]
+    data = data.drop_duplicates(subset=keys, keep='last')
+    if not data['Period'].is_monotonic_increasing:
+        data = data.sort_values('Period', kind='stable')
+    return (data, report) if with_report else data
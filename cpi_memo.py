@@ -0,0 +1,239 @@
+"""Memoization for Dash callbacks.
+
+Results are keyed on the callback, its arguments and the dataset version,
+kept for a TTL in an in-process or local-filesystem backend, and computed
+once when identical requests arrive together: the first caller computes
+while the others wait for its result (single flight).  The filesystem
+backend is shared by every gunicorn worker on the host and also coalesces
+across them with a lock file per key.
+
+    memo = CallbackMemo.from_env(version=content_digest(source))
+
+    @app.callback(Output(...), Input(...))
+    @memo.memoize()
+    def update(value):
+        ...
+"""
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; coalesce per process only
+    fcntl = None
+
+
+class MemoryBackend:
+    """Per-process dict of ``key -> (expires, value)``."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return False, None
+            return True, entry[1]
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self._lock:
+            for stale in [k for k, (expires, _) in self._entries.items() if expires < now]:
+                del self._entries[stale]
+            self._entries[key] = (now + ttl, value)
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        yield
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileBackend:
+    """One pickle file per key under ``directory``, shared across processes.
+
+    Each entry's modification time is set to its expiry, so ``set`` can
+    sweep expired entries (and the lock files and abandoned temporary
+    files they leave) from their ``stat`` alone, at most once every
+    ``sweep_interval`` seconds per process.
+    """
+
+    def __init__(self, directory=None, sweep_interval=60):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'cpi-memo')
+        os.makedirs(self.directory, exist_ok=True)
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0.0
+
+    def _path(self, key, suffix='.pkl'):
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as fh:
+                expires, value = pickle.load(fh)
+        except Exception:
+            # Missing, partly written or unreadable (e.g. pickled by another
+            # version of the app): recompute
+            return False, None
+        if expires < time.time():
+            with contextlib.suppress(OSError):
+                os.remove(self._path(key))
+            return False, None
+        return True, value
+
+    def set(self, key, value, ttl):
+        # Write to a temporary file and rename so readers never see a partial entry
+        expires = time.time() + ttl
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                pickle.dump((expires, value), fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.utime(tmp, (expires, expires))
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
+            raise
+        self.sweep()
+
+    def sweep(self, force=False):
+        """Delete expired entries, their idle lock files and stale temporary files."""
+        now = time.time()
+        if not force and now < self._next_sweep:
+            return
+        self._next_sweep = now + self.sweep_interval
+        locks = []
+        for entry in os.scandir(self.directory):
+            try:
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            stem, suffix = os.path.splitext(entry.name)
+            if (suffix == '.pkl' and mtime < now
+                    or suffix == '.tmp' and mtime < now - self.sweep_interval):
+                with contextlib.suppress(OSError):
+                    os.remove(entry.path)
+            elif suffix == '.lock' and mtime < now - self.sweep_interval:
+                locks.append((stem, entry.path))
+        # Locks last, once the entries they guarded are gone
+        for stem, path in locks:
+            if not os.path.exists(self._path(stem)):
+                self._remove_lock(path)
+
+    @staticmethod
+    def _remove_lock(path):
+        # Only a lock nobody holds: a computation in flight keeps its lock
+        # file locked until it has written the entry
+        with contextlib.suppress(OSError), open(path, 'a') as fh:
+            if fcntl is not None:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.remove(path)
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        if fcntl is None:
+            yield
+            return
+        with open(self._path(key, '.lock'), 'a') as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(('.pkl', '.lock', '.tmp')):
+                with contextlib.suppress(OSError):
+                    os.remove(os.path.join(self.directory, name))
+
+
+class CallbackMemo:
+    """Memoizes callbacks on ``(callback, arguments, version)`` for ``ttl`` seconds."""
+
+    def __init__(self, backend=None, ttl=300, version=None):
+        self.backend = MemoryBackend() if backend is None else backend
+        self.ttl = ttl
+        self.version = version
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @classmethod
+    def from_env(cls, version=None):
+        """Configure from ``CPI_MEMO_BACKEND`` ('memory' or 'filesystem'),
+        ``CPI_MEMO_DIR`` and ``CPI_MEMO_TTL`` (seconds)."""
+        name = os.environ.get('CPI_MEMO_BACKEND', 'memory')
+        if name == 'memory':
+            backend = MemoryBackend()
+        elif name == 'filesystem':
+            backend = FileBackend(os.environ.get('CPI_MEMO_DIR'))
+        else:
+            raise ValueError(f"Unknown CPI_MEMO_BACKEND {name!r} (use 'memory' or 'filesystem')")
+        return cls(backend, ttl=float(os.environ.get('CPI_MEMO_TTL', 300)), version=version)
+
+    def key(self, func, args, kwargs):
+        payload = json.dumps(
+            [self.version, func.__module__, func.__qualname__, args, sorted(kwargs.items())],
+            sort_keys=True, default=repr
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    @contextlib.contextmanager
+    def _single_flight(self, key):
+        # One lock per key in flight; the entry goes away with its last waiter
+        with self._inflight_lock:
+            entry = self._inflight.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0], self.backend.lock(key):
+                yield
+        finally:
+            with self._inflight_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._inflight[key]
+
+    def memoize(self, ttl=None):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                key = self.key(func, args, kwargs)
+                found, value = self.backend.get(key)
+                if found:
+                    self.hits += 1
+                    return value
+                with self._single_flight(key):
+                    # Someone else may have finished it while we waited
+                    found, value = self.backend.get(key)
+                    if found:
+                        self.coalesced += 1
+                        return value
+                    self.misses += 1
+                    value = func(*args, **kwargs)
+                    self.backend.set(key, value, self.ttl if ttl is None else ttl)
+                return value
+            return wrapper
+        return decorator
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, coalesced=self.coalesced)
@@ -0,0 +1,157 @@
+"""Dense period x series panels for the time-series views.
+
+A panel holds the sum and count of one value for every (period, series)
+cell as two ``(periods, series)`` matrices over a contiguous run of Period
+keys.  Rollups to coarser grains, year-over-year change, rolling
+statistics and volatility are then column operations on those matrices
+instead of groupby transforms over the long-format frame.  Cells without
+rows are NaN in :meth:`Panel.mean` and everything derived from it.
+"""
+import numpy as np
+import pandas as pd
+
+# Months per step of each integer time key (see cpi_loader.period_key)
+GRAIN_MONTHS = {'Period': 1, 'Quarter': 3, 'Year': 12}
+
+
+class Panel:
+    """Per-cell ``sums`` and ``counts`` of a value, shape ``(periods, series)``.
+
+    ``periods`` are consecutive keys of the ``key`` grain and ``series``
+    are the sorted labels of the column the panel was built by.
+    """
+
+    def __init__(self, periods, series, sums, counts, key='Period'):
+        self.periods = periods
+        self.series = series
+        self.sums = sums
+        self.counts = counts
+        self.key = key
+
+    @classmethod
+    def from_frame(cls, data, by, value='Inflation (%)'):
+        """Build the monthly panel of ``value`` per ``by`` from the dataset."""
+        values = data[value].to_numpy(dtype=float)
+        valid = ~np.isnan(values) & data[by].notna().to_numpy()
+        return cls.from_totals(data['Period'].to_numpy()[valid], data[by].to_numpy()[valid],
+                               values[valid], np.ones(int(valid.sum())))
+
+    @classmethod
+    def from_totals(cls, periods, labels, sums, counts):
+        """Build the monthly panel from pre-aggregated ``sums``/``counts`` rows.
+
+        Rows may repeat a (period, label) cell; their totals are added.
+        """
+        periods = np.asarray(periods, dtype=np.int64)
+        codes, series = pd.factorize(np.asarray(labels), sort=True)
+        start = int(periods.min()) if periods.size else 0
+        n_periods = int(periods.max()) - start + 1 if periods.size else 0
+        shape = (n_periods, len(series))
+        cells = (periods - start) * len(series) + codes
+        size = shape[0] * shape[1]
+        sums = np.bincount(cells, weights=sums, minlength=size)
+        counts = np.bincount(cells, weights=counts, minlength=size).astype(np.int64)
+        return cls(np.arange(start, start + n_periods), np.asarray(series, dtype=object),
+                   sums.reshape(shape), counts.reshape(shape))
+
+    @property
+    def nbytes(self):
+        return self.periods.nbytes + self.series.nbytes + self.sums.nbytes + self.counts.nbytes
+
+    @property
+    def observed(self):
+        """Boolean mask of the periods with at least one row."""
+        return self.counts.any(axis=1)
+
+    def reindex(self, periods, series):
+        """The panel on the given ``periods`` x ``series`` grid (empty cells added)."""
+        rows = pd.Index(self.periods).get_indexer(periods)
+        columns = pd.Index(self.series).get_indexer(series)
+        sums = np.zeros((len(periods), len(series)))
+        counts = np.zeros((len(periods), len(series)), dtype=np.int64)
+        found = np.ix_(rows >= 0, columns >= 0)
+        picked = np.ix_(rows[rows >= 0], columns[columns >= 0])
+        sums[found], counts[found] = self.sums[picked], self.counts[picked]
+        return Panel(np.asarray(periods), np.asarray(series, dtype=object), sums, counts,
+                     key=self.key)
+
+    def lookup(self, periods, series):
+        """Mean of the cell at each ``(periods[i], series[i])`` pair (NaN when absent)."""
+        rows = pd.Index(self.periods).get_indexer(periods)
+        columns = pd.Index(self.series).get_indexer(series)
+        found = (rows >= 0) & (columns >= 0)
+        values = np.full(len(found), np.nan)
+        values[found] = self.mean()[rows[found], columns[found]]
+        return values
+
+    def mean(self):
+        return np.divide(self.sums, self.counts, out=np.full(self.sums.shape, np.nan),
+                         where=self.counts > 0)
+
+    def rollup(self, key):
+        """Re-bucket the panel to a coarser time ``key`` ('Quarter' or 'Year').
+
+        Sums and counts are added, so the means stay row-weighted exactly
+        like a groupby on the raw rows.
+        """
+        keys = self.periods * GRAIN_MONTHS[self.key] // GRAIN_MONTHS[key]
+        if not keys.size:
+            return Panel(keys, self.series, self.sums, self.counts, key=key)
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        return Panel(keys[starts], self.series, np.add.reduceat(self.sums, starts, axis=0),
+                     np.add.reduceat(self.counts, starts, axis=0), key=key)
+
+    def shift(self, periods):
+        """Mean matrix moved down by ``periods`` rows (NaN-filled)."""
+        means = self.mean()
+        shifted = np.full(means.shape, np.nan)
+        if periods < len(means):
+            shifted[periods:] = means[:len(means) - periods]
+        return shifted
+
+    def pct_change(self, periods=None):
+        """Percent change against ``periods`` steps earlier (one year by default).
+
+        On a panel of ``Index`` this is the year-over-year inflation rate.
+        """
+        periods = 12 // GRAIN_MONTHS[self.key] if periods is None else periods
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (self.mean() / self.shift(periods) - 1) * 100
+
+    def rolling_std(self, window, min_periods=1):
+        """Sample standard deviation over each series' last ``window`` observed values.
+
+        Like a rolling std over the rows of each series, empty cells do not
+        count toward the window and stay NaN.  Each column's observed cells
+        are moved to the top (in order) so windowed sums come from
+        cumulative sums for every series at once, then put back in place.
+        """
+        means = self.mean()
+        valid = ~np.isnan(means)
+        order = np.argsort(~valid, axis=0, kind='stable')
+        observed = np.take_along_axis(valid, order, axis=0)
+        x = np.where(observed, np.take_along_axis(means, order, axis=0), 0.0)
+
+        def windowed(a):
+            total = np.cumsum(a, axis=0)
+            total[window:] -= total[:-window].copy()
+            return total
+
+        n = windowed(observed.astype(float))
+        s = windowed(x)
+        ss = windowed(x * x)
+        enough = observed & (n >= max(min_periods, 2))
+        var = np.divide(ss - s * s / np.maximum(n, 1), n - 1,
+                        out=np.full(means.shape, np.nan), where=enough)
+        result = np.empty(means.shape)
+        np.put_along_axis(result, order, np.sqrt(np.clip(var, 0, None)), axis=0)
+        return result
+
+    def std(self):
+        """Sample standard deviation of each series over time (volatility)."""
+        means = self.mean()
+        n = (~np.isnan(means)).sum(axis=0)
+        centered = means - np.divide(np.nansum(means, axis=0), n,
+                                     out=np.full(n.shape, np.nan), where=n > 0)
+        return np.divide(np.nansum(centered ** 2, axis=0), n - 1,
+                         out=np.full(n.shape, np.nan), where=n > 1) ** 0.5
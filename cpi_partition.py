@@ -0,0 +1,332 @@
+"""Out-of-core aggregation of a dataset partitioned by Year.
+
+    python cpi_partition.py --data "backfill/*.csv" --workers 8
+
+The source files are streamed in chunks through :func:`cpi_loader.clean_data`
+and spilled to one set of pickles per Year, so no step holds more than one
+chunk or one Year at a time.  A process pool then reduces each Year to
+partial aggregates, which are merged into everything
+:class:`cpi_figures.FigureFactory` reads: the rollups, panels and
+cross-filter totals (sum, count and sum of squares per group), medians,
+the per-value row counts behind the distribution views and the order in
+which labels first appear.  The apps then never load the rows.  Months
+repeated across releases share a Year, so they are deduplicated inside
+their partition exactly as :func:`cpi_loader.load_dataset` does.
+
+Medians of groups that lie within one Year (their keys include Year,
+Quarter or Period) are exact; any other median is read from mergeable
+quantile sketches of ``k`` items, with a rank error of about ``1.7 / k``.
+The partitions are kept on disk while the rollups are alive, so panels
+filtered by other columns (the Vis 3 and Vis 4 filters) are reduced from
+them one Year at a time on demand.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from cpi_figures import CROSSFILTER_TABLES, DERIVED_KEYS, DISTRIBUTIONS, PANELS, ROLLUPS
+from cpi_loader import KEY_COLUMNS, clean_data, combine_reports, resolve_sources
+from cpi_panel import Panel
+from cpi_stats import box_frame, build_sketches, count_histogram, merge_sketches
+
+TOTALS = ['sum', 'count', 'sumsq']
+
+# Keys that pin a group to one Year partition, so its median is exact
+PARTITION_KEYS = {'Year', 'Quarter', 'Period'}
+
+
+def partition_by_year(source, directory, chunksize=200_000):
+    """Clean ``source`` chunk by chunk into ``directory``.
+
+    Returns ``(partitions, rejected)``: ``{year: [paths]}`` with the paths
+    in source order, so later releases still win, and the rows rejected
+    while cleaning, per file and reason.
+    """
+    partitions, reports = {}, []
+    for index, item in enumerate(resolve_sources(source)):
+        if hasattr(item, 'seek'):
+            item.seek(0)
+        chunks = []
+        for number, chunk in enumerate(pd.read_csv(item, chunksize=chunksize)):
+            clean, report = clean_data(chunk)
+            chunks.append(report)
+            for year, part in clean.groupby('Year', sort=False):
+                path = os.path.join(directory, f"{year}-{index:05d}-{number:05d}.pkl")
+                part.to_pickle(path)
+                partitions.setdefault(int(year), []).append(path)
+        report = combine_reports(chunks)
+        report.insert(0, 'file', str(getattr(item, 'name', item)))
+        reports.append(report)
+    return partitions, pd.concat(reports, ignore_index=True)
+
+
+def _key_sets(rollups, panels, tables=()):
+    key_sets = {tuple(keys): how == 'median' for keys, how in rollups}
+    for by in panels:
+        key_sets.setdefault(('Period', by), False)
+    for dims in tables:
+        key_sets.setdefault(tuple(dims), False)
+    return key_sets
+
+
+def _read_partition(paths):
+    # One Year, deduplicated and ordered like cpi_loader.load_dataset
+    frame = pd.concat([pd.read_pickle(path) for path in paths], ignore_index=True)
+    frame = frame.drop_duplicates(
+        subset=[column for column in KEY_COLUMNS if column in frame.columns], keep='last'
+    )
+    return frame.sort_values('Period', kind='stable')
+
+
+def aggregate_partition(paths, key_sets, value='Inflation (%)', k=200, distributions=(),
+                        labels=(), where=()):
+    """Partial aggregates of one Year partition (restricted to the rows matching ``where``).
+
+    Returns a dict with
+    ``totals``: ``{keys: (totals, medians)}``, a frame of ``TOTALS`` per group
+    and, for the key sets that need quantiles, exact medians (a Series) when
+    the keys pin a group to this Year, else a ``{group: sketch}`` dict;
+    ``counts``: ``{(value, by): Series}`` of rows per distinct ``(by, value)``
+    for each pair in ``distributions``;
+    ``labels``: ``{column: array}`` of the distinct values of each
+    ``labels`` column in order of appearance.
+    """
+    frame = _read_partition(paths)
+    if where:
+        frame = frame[np.logical_and.reduce([frame[column].to_numpy() == selected
+                                             for column, selected in where])]
+    derived = {key for keys in key_sets for key in keys if key in DERIVED_KEYS}
+    frame = frame.assign(**{key: DERIVED_KEYS[key](frame) for key in derived})
+    x = frame[value].to_numpy(dtype=float)
+    frame = frame.assign(_sum=x, _count=1, _sumsq=x * x)
+    totals = {}
+    for keys, quantiles in key_sets.items():
+        grouped = frame.groupby(list(keys), sort=False)
+        sums = grouped[['_sum', '_count', '_sumsq']].sum()
+        sums.columns = TOTALS
+        medians = None
+        if quantiles:
+            if PARTITION_KEYS.intersection(keys):
+                medians = grouped[value].median()
+            else:
+                medians = build_sketches(frame, value, keys, k=k)
+        totals[keys] = (sums, medians)
+    counts = {(column, by): frame.groupby([by, column]).size() for column, by in distributions}
+    return dict(totals=totals, counts=counts,
+                labels={column: frame[column].dropna().unique() for column in labels})
+
+
+def _remove_directory(path, pid):
+    # A server forked after the rollups were built inherits them; only the
+    # process that wrote the partitions removes them
+    if os.getpid() == pid:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class Rollups:
+    """Merged partial aggregates, served in the shape the figure factory expects.
+
+    ``partitions`` (the per-Year pickle paths, in Year order) serve the
+    filtered panels; pass ``directory`` to have it deleted with the rollups.
+    """
+
+    def __init__(self, totals, medians, value='Inflation (%)', counts=None, labels=None,
+                 partitions=(), directory=None, rejected=None):
+        self.totals = totals
+        self.medians = medians
+        self.value = value
+        self.counts = counts or {}
+        self.label_orders = labels or {}
+        self.partitions = list(partitions)
+        self.rejected = rejected
+        if directory is not None:
+            weakref.finalize(self, _remove_directory, directory, os.getpid())
+
+    @classmethod
+    def merge(cls, partials, value='Inflation (%)', **kwargs):
+        totals, medians, counts, labels = {}, {}, {}, {}
+        for keys in partials[0]['totals'] if partials else []:
+            parts = [partial['totals'][keys] for partial in partials]
+            levels = list(range(len(keys)))
+            totals[keys] = pd.concat([t for t, _ in parts]).groupby(level=levels).sum()
+            if isinstance(parts[0][1], pd.Series):
+                # Each group lies in one partition
+                medians[keys] = pd.concat([m for _, m in parts])
+            elif parts[0][1] is not None:
+                medians[keys] = merge_sketches(*(m for _, m in parts))
+        for pair in partials[0]['counts'] if partials else []:
+            parts = [partial['counts'][pair] for partial in partials]
+            counts[pair] = pd.concat(parts).groupby(level=[0, 1]).sum()
+        for column in partials[0]['labels'] if partials else []:
+            labels[column] = pd.unique(np.concatenate([partial['labels'][column]
+                                                       for partial in partials]))
+        return cls(totals, medians, value, counts=counts, labels=labels, **kwargs)
+
+    @property
+    def nbytes(self):
+        def size(medians):
+            if isinstance(medians, pd.Series):
+                return medians.memory_usage(deep=True)
+            return sum(sketch.nbytes for sketch in medians.values())
+
+        return int(sum(t.memory_usage(deep=True).sum() for t in self.totals.values())
+                   + sum(size(m) for m in self.medians.values())
+                   + sum(c.memory_usage(deep=True) for c in self.counts.values())
+                   + sum(labels.nbytes for labels in self.label_orders.values()))
+
+    def get(self, keys, how, value='Inflation (%)'):
+        """Aggregate ``how`` ('mean', 'std', 'count', 'median') of ``value`` per ``keys``,
+        or None when it was not precomputed."""
+        keys = tuple(keys)
+        if value != self.value or keys not in self.totals:
+            return None
+        totals = self.totals[keys]
+        if how == 'mean':
+            result = totals['sum'] / totals['count']
+        elif how == 'count':
+            result = totals['count']
+        elif how == 'std':
+            n = totals['count']
+            result = np.sqrt(((totals['sumsq'] - totals['sum'] ** 2 / n) / (n - 1)).clip(lower=0))
+            result[n < 2] = np.nan
+        elif how == 'median' and keys in self.medians:
+            medians = self.medians[keys]
+            if isinstance(medians, pd.Series):
+                result = medians.reindex(totals.index)
+            else:
+                # Sketches are keyed by tuples, even for a single key
+                groups = totals.index if len(keys) > 1 else [(key,) for key in totals.index]
+                result = pd.Series([medians[key].median() for key in groups],
+                                   index=totals.index)
+        else:
+            return None
+        return result.rename(value).sort_index().reset_index()
+
+    def panel(self, by, value='Inflation (%)', where=()):
+        """Monthly :class:`cpi_panel.Panel` of ``value`` per ``by``, or None.
+
+        Filtered panels (``where``) are reduced from the partitions, one
+        Year at a time.
+        """
+        key = ('Period', by)
+        if value != self.value:
+            return None
+        if where:
+            if not self.partitions:
+                return None
+            parts = [aggregate_partition(paths, {key: False}, value, where=where)['totals'][key][0]
+                     for paths in self.partitions]
+            totals = pd.concat(parts).groupby(level=[0, 1]).sum()
+        else:
+            totals = self.totals.get(key)
+            if totals is None:
+                return None
+        return Panel.from_totals(totals.index.get_level_values(0), totals.index.get_level_values(1),
+                                 totals['sum'].to_numpy(), totals['count'].to_numpy())
+
+    def _distribution(self, value, by):
+        counts = self.counts.get((value, by))
+        if counts is None:
+            return None
+        codes, labels = pd.factorize(counts.index.get_level_values(0), sort=True)
+        return (counts.index.get_level_values(1).to_numpy(dtype=float), counts.to_numpy(),
+                codes, np.asarray(labels))
+
+    def histogram(self, value='Index', by='Group', bins='auto'):
+        """:func:`cpi_stats.histogram_summary` from the per-value row counts, or None."""
+        distribution = self._distribution(value, by)
+        if distribution is None:
+            return None
+        values, counts, codes, labels = distribution
+        return count_histogram(values, counts, codes, labels, by, bins)
+
+    def box(self, value='Index', by='Group'):
+        """:func:`cpi_stats.box_summary` from the per-value row counts, or None."""
+        distribution = self._distribution(value, by)
+        if distribution is None:
+            return None
+        values, counts, codes, labels = distribution
+        return box_frame(values, codes, labels, by, value, counts=counts)
+
+    def labels(self, column):
+        """Distinct values of ``column`` in order of appearance, or None."""
+        return self.label_orders.get(column)
+
+    def crossfilter(self, value='Inflation (%)', dims=()):
+        """Sum and count of ``value`` per ``dims`` cell, or None."""
+        totals = self.totals.get(tuple(dims))
+        if totals is None or value != self.value:
+            return None
+        return totals[['sum', 'count']].reset_index()
+
+
+def _aggregate_task(args):
+    return aggregate_partition(*args)
+
+
+def aggregate_partitioned(source, rollups=ROLLUPS, panels=PANELS, tables=CROSSFILTER_TABLES,
+                          distributions=DISTRIBUTIONS, value='Inflation (%)', workers=None,
+                          chunksize=200_000, k=200):
+    """Compute ``rollups``, ``panels`` and cross-filter ``tables`` for ``source`` one Year at a time.
+
+    ``workers`` processes reduce the partitions in parallel (default: one
+    per core; 1 reduces them in-process).  ``k`` sizes the quantile
+    sketches of medians over groups spanning several Years.
+    """
+    key_sets = _key_sets(rollups, panels, tables.values())
+    directory = tempfile.mkdtemp(prefix='cpi-partitions-')
+    try:
+        partitions, rejected = partition_by_year(source, directory, chunksize=chunksize)
+        partitions = [paths for _, paths in sorted(partitions.items())]
+        tasks = [(paths, key_sets, value, k, distributions, panels) for paths in partitions]
+        if workers == 1:
+            partials = list(map(_aggregate_task, tasks))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                partials = list(pool.map(_aggregate_task, tasks))
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    return Rollups.merge(partials, value, partitions=partitions, directory=directory,
+                         rejected=rejected)
+
+
+def rollups_from_env(source, variable='CPI_ROLLUP_WORKERS'):
+    """Partitioned rollups when ``variable`` sets a worker count, else None.
+
+    CPI_ROLLUP_K sets the sketch size ``k`` (default 200).
+    """
+    workers = int(os.environ.get(variable, 0))
+    if not workers:
+        return None
+    return aggregate_partitioned(source, workers=workers, k=int(os.environ.get('CPI_ROLLUP_K', 200)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default=os.environ.get('CPI_DATA', 'cpi Group data.csv'),
+                        help="CSV file, directory of CSVs or glob pattern")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: one per core; 1 reduces in-process)")
+    parser.add_argument('--chunksize', type=int, default=200_000, help="rows per read")
+    parser.add_argument('--k', type=int, default=200,
+                        help="quantile sketch size for medians spanning several Years")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    result = aggregate_partitioned(args.data, workers=args.workers, chunksize=args.chunksize,
+                                   k=args.k)
+    print(f"Aggregated {args.data} in {time.perf_counter() - start:.2f}s")
+    for keys, totals in result.totals.items():
+        print(f"  {' x '.join(keys):<20}{len(totals):>8} groups{int(totals['count'].sum()):>12} rows")
+
+
+if __name__ == '__main__':
+    main()
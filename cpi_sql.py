@@ -0,0 +1,517 @@
+"""Embedded SQL storage for datasets larger than a worker's memory.
+
+    python cpi_sql.py --data "backfill/*.csv" --database cpi.sqlite
+
+The source files are streamed in chunks through :func:`cpi_loader.clean_data`
+into one ``cpi`` table of a local SQLite file (or a DuckDB file when the
+name ends in ``.duckdb`` and the ``duckdb`` package is installed).  Keys are
+the table's primary key, so months repeated across releases (or within a
+file) are replaced by the later row exactly as
+:func:`cpi_loader.load_dataset` does.
+
+:class:`SQLStore` answers the figure factory's aggregates (means, medians,
+standard deviations, Period x ``by`` panels, histograms, box plots and the
+cross-filter marginals) as SQL over a small pool of read-only connections,
+so the apps never load the table into pandas.  It has the ``get``/``panel``
+interface of :class:`cpi_partition.Rollups` and is passed to
+:class:`cpi_figures.FigureFactory` as ``rollups`` with ``data=None``.
+
+    python cpi_sql.py --database cpi.sqlite --verify --data "backfill/*.csv"
+
+checks every pushed-down aggregate of a database against pandas and numpy
+on the loaded source.
+"""
+import argparse
+import contextlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from cpi_cache import content_digest
+from cpi_loader import (KEY_COLUMNS, NUMERIC_COLUMNS, REPORT_COLUMNS, clean_data, combine_reports,
+                        load_dataset, resolve_sources)
+from cpi_panel import Panel
+from cpi_figures import CROSSFILTER_TABLES, DERIVED_KEYS, DISTRIBUTIONS, PANELS, ROLLUPS, FigureFactory
+from cpi_stats import count_histogram, thin_outliers
+
+try:
+    import duckdb
+except ImportError:  # optional; SQLite is always available
+    duckdb = None
+
+DATABASE_SUFFIXES = ('.sqlite', '.sqlite3', '.db', '.duckdb')
+
+# Stored columns and their SQL types (DOUBLE: REAL is single precision in
+# DuckDB); Date is derived from Period on read
+COLUMNS = {
+    'Sector': 'TEXT', 'Period': 'INTEGER', 'State': 'TEXT', 'Group': 'TEXT',
+    'Year': 'INTEGER', 'Month': 'TEXT', 'Index': 'DOUBLE', 'Inflation (%)': 'DOUBLE',
+}
+
+# (Year, Month, State, Sector, Group) for lookups by calendar month; (Group,
+# Sector, Period) for the filtered panels behind the Vis 3 filter
+INDEXES = {
+    'cpi_calendar': ['Year', 'Month', 'State', 'Sector', 'Group'],
+    'cpi_filter': ['Group', 'Sector', 'Period'],
+}
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def is_database(source):
+    """Whether ``source`` is a database file built by :func:`build_database`."""
+    return (isinstance(source, (str, os.PathLike))
+            and os.fspath(source).lower().endswith(DATABASE_SUFFIXES))
+
+
+def _is_duckdb(path):
+    return os.fspath(path).lower().endswith('.duckdb')
+
+
+def _connect(path, read_only=True, duck=None):
+    if _is_duckdb(path) if duck is None else duck:
+        if duckdb is None:
+            raise ImportError(f"{path!r} is a DuckDB database; install the duckdb package")
+        return duckdb.connect(os.fspath(path), read_only=read_only)
+    if read_only:
+        uri = 'file:' + os.path.abspath(path) + '?mode=ro'
+        return sqlite3.connect(uri, uri=True, check_same_thread=False)
+    return sqlite3.connect(path, check_same_thread=False)
+
+
+# -------------------------------
+# Building a database
+# -------------------------------
+def build_database(source, path, chunksize=200_000):
+    """Load ``source`` into a new database at ``path``; returns the row count.
+
+    The database is written next to ``path`` and moved into place when
+    complete, so servers reading the old file are not disturbed.
+    """
+    sources = resolve_sources(source)
+    partial = f"{path}.building"
+    if os.path.exists(partial):
+        os.remove(partial)
+    duck = _is_duckdb(path)
+    conn = _connect(partial, read_only=False, duck=duck)
+    columns = ', '.join(_quote(c) for c in COLUMNS)
+    conn.execute(f"CREATE TABLE cpi ({', '.join(f'{_quote(c)} {t}' for c, t in COLUMNS.items())}, "
+                 f"PRIMARY KEY ({', '.join(_quote(c) for c in KEY_COLUMNS)}))")
+    conn.execute("CREATE TABLE rejected (file TEXT, reason TEXT, rows INTEGER, examples TEXT)")
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    if not duck:
+        # A failed build is thrown away, so skip the rollback journal
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+    insert = f"INSERT OR REPLACE INTO cpi ({columns}) VALUES ({', '.join('?' * len(COLUMNS))})"
+    for item in sources:
+        name = str(getattr(item, 'name', item))
+        reports = []
+        if hasattr(item, 'seek'):
+            item.seek(0)
+        for chunk in pd.read_csv(item, chunksize=chunksize):
+            clean, report = clean_data(chunk)
+            reports.append(report)
+            # One statement must not insert a key twice (DuckDB rejects it)
+            rows = clean[list(COLUMNS)].drop_duplicates(subset=KEY_COLUMNS, keep='last')
+            if duck:
+                conn.register('chunk', rows)
+                conn.execute("INSERT OR REPLACE INTO cpi SELECT * FROM chunk")
+                conn.unregister('chunk')
+            else:
+                conn.executemany(insert, rows.itertuples(index=False, name=None))
+        for reason, rows, examples in combine_reports(reports).itertuples(index=False):
+            conn.execute("INSERT INTO rejected VALUES (?, ?, ?, ?)",
+                         (name, reason, rows, json.dumps(examples, default=str)))
+    for name, index_columns in INDEXES.items():
+        conn.execute(f"CREATE INDEX {name} ON cpi ({', '.join(_quote(c) for c in index_columns)})")
+    count = conn.execute("SELECT COUNT(*) FROM cpi").fetchone()[0]
+    conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+        ('version', content_digest(sources)), ('rows', str(count)),
+    ])
+    if not duck:
+        conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    os.replace(partial, path)
+    return count
+
+
+def database_version(path):
+    """Content digest of the files the database at ``path`` was built from."""
+    conn = _connect(path)
+    try:
+        return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+    finally:
+        conn.close()
+
+
+# -------------------------------
+# Connection pool
+# -------------------------------
+class ConnectionPool:
+    """Up to ``size`` read-only connections shared by the server's threads.
+
+    Connections are opened on demand and handed out one thread at a time; a
+    thread asking while all are busy waits for one to come back.  A pool
+    inherited across ``fork`` (e.g. gunicorn ``--preload``) starts afresh.
+    """
+
+    def __init__(self, path, size=4):
+        self.path = path
+        self.size = size
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._base = None
+
+    def _open(self):
+        if not _is_duckdb(self.path):
+            return _connect(self.path)
+        # DuckDB threads share one database handle through cursors
+        if self._base is None:
+            self._base = _connect(self.path)
+        return self._base.cursor()
+
+    @contextlib.contextmanager
+    def connection(self):
+        if self._pid != os.getpid():
+            self._reset()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                opened = self._opened < self.size
+                if opened:
+                    conn = self._open()
+                    self._opened += 1
+            if not opened:
+                conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+
+# -------------------------------
+# Pushed-down aggregates
+# -------------------------------
+class SQLStore:
+    """Figure aggregates computed by the database behind ``pool``."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.duckdb = _is_duckdb(pool.path)
+        meta = dict(self.query("SELECT key, value FROM meta").itertuples(index=False))
+        self.version = meta['version']
+        self.rows = int(meta['rows'])
+        rejected = self.query("SELECT file, reason, rows, examples FROM rejected")
+        rejected['examples'] = [json.loads(examples) for examples in rejected['examples']]
+        self.rejected = rejected[['file'] + REPORT_COLUMNS]
+
+    @classmethod
+    def from_env(cls, path):
+        """Store over ``path`` with CPI_SQL_POOL connections (default 4)."""
+        return cls(ConnectionPool(path, size=int(os.environ.get('CPI_SQL_POOL', 4))))
+
+    @property
+    def nbytes(self):
+        # Everything lives in the database file
+        return 0
+
+    def query(self, sql, params=()):
+        with self.pool.connection() as conn:
+            cursor = conn.execute(sql, list(params))
+            rows = cursor.fetchall()
+            columns = [column[0] for column in cursor.description]
+        return pd.DataFrame.from_records(rows, columns=columns)
+
+    def _key(self, key):
+        # SQL expression of a grouping key (see cpi_figures.DERIVED_KEYS)
+        if key == 'Quarter':
+            return '"Period" // 3' if self.duckdb else '"Period" / 3'
+        if key == 'Month_Num':
+            return '"Period" % 12'
+        return _quote(key)
+
+    def _select_keys(self, keys):
+        return ', '.join(f"{self._key(key)} AS {_quote(key)}" for key in keys)
+
+    def _where(self, where, value=None):
+        clauses = [f"{_quote(column)} = ?" for column, _ in where]
+        if value is not None:
+            clauses.append(f"{_quote(value)} IS NOT NULL")
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', [v for _, v in where]
+
+    def quantiles(self, keys, qs, value='Inflation (%)'):
+        """Quantiles ``qs`` of ``value`` per ``keys`` with numpy's linear interpolation.
+
+        Returns the keys, ``n`` and one column per quantile.  SQLite ranks
+        the rows of each group with window functions and only the rows next
+        to each quantile position come back; DuckDB has ``quantile_cont``.
+        """
+        keys = list(keys)
+        v = _quote(value)
+        group = f" GROUP BY {', '.join(str(i + 1) for i in range(len(keys)))}" if keys else ''
+        select = self._select_keys(keys) + ', ' if keys else ''
+        if self.duckdb:
+            parts = ', '.join(f"quantile_cont({v}, {float(q)}) AS q{i}" for i, q in enumerate(qs))
+            result = self.query(f"SELECT {select}COUNT({v}) AS n, {parts} FROM cpi "
+                                f"WHERE {v} IS NOT NULL{group}")
+            return result.rename(columns={f"q{i}": q for i, q in enumerate(qs)})
+        partition = f"PARTITION BY {', '.join(self._key(key) for key in keys)} " if keys else ''
+        positions = ' OR '.join(
+            f"r = CAST({float(q)} * (n - 1) AS INTEGER) OR "
+            f"r = CAST({float(q)} * (n - 1) AS INTEGER) + ({float(q)} * (n - 1) > CAST({float(q)} * (n - 1) AS INTEGER))"
+            for q in qs
+        )
+        rows = self.query(
+            f"SELECT * FROM (SELECT {select}{v} AS v, "
+            f"ROW_NUMBER() OVER ({partition}ORDER BY {v}) - 1 AS r, "
+            f"COUNT(*) OVER ({partition.strip()}) AS n FROM cpi WHERE {v} IS NOT NULL) "
+            f"WHERE {positions}"
+        )
+        ranked = rows.set_index(keys + ['r'])['v'] if keys else rows.set_index('r')['v']
+        result = (rows.drop_duplicates(keys) if keys else rows.iloc[:1])[keys + ['n']]
+        result = result.reset_index(drop=True)
+        n = result['n'].to_numpy()
+        for q in qs:
+            pos = q * (n - 1)
+            lo, hi = np.floor(pos).astype(np.int64), np.ceil(pos).astype(np.int64)
+            if keys:
+                at = [pd.MultiIndex.from_arrays([result[key] for key in keys] + [rank])
+                      for rank in (lo, hi)]
+            else:
+                at = [lo, hi]
+            low, high = (ranked.reindex(index).to_numpy(dtype=float) for index in at)
+            result[q] = low + (high - low) * (pos - lo)
+        return result
+
+    def get(self, keys, how, value='Inflation (%)'):
+        """Aggregate ``how`` ('mean', 'std', 'count', 'median') of ``value`` per ``keys``."""
+        keys = list(keys)
+        if value not in NUMERIC_COLUMNS:
+            return None
+        v = _quote(value)
+        group = ', '.join(str(i + 1) for i in range(len(keys)))
+        if how == 'median':
+            result = self.quantiles(keys, [0.5], value).rename(columns={0.5: value})
+        elif how in ('mean', 'count'):
+            function = 'AVG' if how == 'mean' else 'COUNT'
+            result = self.query(f"SELECT {self._select_keys(keys)}, {function}({v}) AS {v} "
+                                f"FROM cpi GROUP BY {group}")
+        elif how == 'std':
+            totals = self.query(f"SELECT {self._select_keys(keys)}, SUM({v}) AS s, "
+                                f"SUM({v} * {v}) AS ss, COUNT({v}) AS n FROM cpi GROUP BY {group}")
+            n = totals['n'].to_numpy(dtype=float)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                std = np.sqrt(np.clip((totals['ss'] - totals['s'] ** 2 / n) / (n - 1), 0, None))
+            result = totals[keys].assign(**{value: np.where(n < 2, np.nan, std)})
+        else:
+            return None
+        return result[keys + [value]].sort_values(keys, ignore_index=True)
+
+    def panel(self, by, value='Inflation (%)', where=()):
+        """Monthly :class:`cpi_panel.Panel` of ``value`` per ``by`` (rows matching ``where``)."""
+        v = _quote(value)
+        clause, params = self._where(where, value)
+        totals = self.query(f"SELECT \"Period\", {_quote(by)} AS label, SUM({v}) AS s, "
+                            f"COUNT({v}) AS n FROM cpi{clause} GROUP BY 1, 2", params)
+        return Panel.from_totals(totals['Period'].to_numpy(), totals['label'].to_numpy(),
+                                 totals['s'].to_numpy(dtype=float), totals['n'].to_numpy())
+
+    def histogram(self, value='Index', by='Group', bins='auto'):
+        """:func:`cpi_stats.histogram_summary` from per-value row counts.
+
+        The database returns one row per distinct (group, value), which is
+        binned exactly like the rows themselves (see
+        :func:`cpi_stats.count_histogram`).
+        """
+        counts = self.query(f"SELECT {_quote(by)} AS g, {_quote(value)} AS v, COUNT(*) AS n "
+                            f"FROM cpi WHERE {_quote(value)} IS NOT NULL GROUP BY 1, 2")
+        codes, labels = pd.factorize(counts['g'], sort=True)
+        return count_histogram(counts['v'].to_numpy(dtype=float), counts['n'].to_numpy(),
+                               codes, np.asarray(labels), by, bins)
+
+    def box(self, value='Index', by='Group', whisker=1.5, max_outliers=50):
+        """:func:`cpi_stats.box_summary` with quartiles, fences and outliers in SQL."""
+        quartiles = self.quantiles([by], [0.25, 0.5, 0.75], value).sort_values(by, ignore_index=True)
+        if quartiles.empty:
+            return (pd.DataFrame(columns=[by, 'q1', 'median', 'q3', 'lowerfence', 'upperfence', 'count']),
+                    pd.DataFrame(columns=[by, value]))
+        q1, q3 = quartiles[0.25].to_numpy(), quartiles[0.75].to_numpy()
+        limits = pd.DataFrame({'g': quartiles[by], 'lo': q1 - whisker * (q3 - q1),
+                               'hi': q3 + whisker * (q3 - q1)})
+        # Limits per group as an inline table joined against the rows
+        values_sql = ', '.join(['(?, ?, ?)'] * len(limits))
+        params = [item for row in limits.itertuples(index=False) for item in
+                  (row.g, float(row.lo), float(row.hi))]
+        v, g = _quote(value), _quote(by)
+        with_limits = f"WITH limits(g, lo, hi) AS (VALUES {values_sql}) "
+        join = f"FROM cpi JOIN limits ON cpi.{g} = limits.g WHERE {v} IS NOT NULL"
+        fences = self.query(
+            with_limits + f"SELECT limits.g AS g, MIN(CASE WHEN {v} >= limits.lo THEN {v} END) AS lf, "
+            f"MAX(CASE WHEN {v} <= limits.hi THEN {v} END) AS uf {join} GROUP BY 1", params
+        ).set_index('g').reindex(quartiles[by])
+        stats = pd.DataFrame({
+            by: quartiles[by].to_numpy(), 'q1': q1, 'median': quartiles[0.5].to_numpy(), 'q3': q3,
+            'lowerfence': fences['lf'].to_numpy(dtype=float),
+            'upperfence': fences['uf'].to_numpy(dtype=float),
+            'count': quartiles['n'].to_numpy(dtype=np.int64),
+        })
+        outliers = self.query(
+            with_limits + f"SELECT limits.g AS g, {v} AS v {join} "
+            f"AND ({v} < limits.lo OR {v} > limits.hi) ORDER BY 1, 2", params
+        )
+        codes = pd.Index(quartiles[by]).get_indexer(outliers['g'])
+        kept = outliers[thin_outliers(codes, max_outliers)]
+        return stats, pd.DataFrame({by: kept['g'].to_numpy(), value: kept['v'].to_numpy(dtype=float)})
+
+    def crossfilter(self, value='Inflation (%)', dims=('Group', 'Sector', 'State')):
+        """Sum and count of ``value`` per ``dims`` cell.
+
+        The factory asks for one marginal per cross-filtered view (see
+        :data:`cpi_figures.CROSSFILTER_TABLES`), never the full key grain.
+        """
+        v = _quote(value)
+        return self.query(f"SELECT {self._select_keys(dims)}, SUM({v}) AS sum, "
+                          f"COUNT({v}) AS count FROM cpi "
+                          f"GROUP BY {', '.join(str(i + 1) for i in range(len(dims)))}")
+
+    def labels(self, column):
+        """Distinct values of ``column`` in the order their rows were stored."""
+        return self.query(f"SELECT {_quote(column)} AS label FROM cpi WHERE {_quote(column)} "
+                          f"IS NOT NULL GROUP BY 1 ORDER BY MIN(rowid)")['label'].to_numpy()
+
+
+# -------------------------------
+# Verification
+# -------------------------------
+# Key sets whose quantiles are checked against numpy, including derived keys
+QUANTILE_KEYS = [(), ('Group',), ('Period', 'Group'), ('Month_Num', 'Year'), ('Quarter', 'State')]
+
+
+def _difference(expected, actual):
+    # Largest absolute difference between two frames' values; inf when their
+    # rows, keys or missing values differ
+    expected = expected.reset_index(drop=True)
+    actual = actual.reset_index(drop=True)
+    if expected.shape != actual.shape or list(expected.columns) != list(actual.columns):
+        return np.inf
+    worst = 0.0
+    for column in expected.columns:
+        a, b = expected[column].to_numpy(), actual[column].to_numpy()
+        if a.dtype.kind != 'f' and b.dtype.kind != 'f':
+            if not np.array_equal(a, b):
+                return np.inf
+            continue
+        a, b = a.astype(float), b.astype(float)
+        missing = np.isnan(a)
+        if not np.array_equal(missing, np.isnan(b)):
+            return np.inf
+        if (~missing).any():
+            worst = max(worst, float(np.abs(a[~missing] - b[~missing]).max()))
+    return worst
+
+
+def _panel_frame(panel):
+    periods = np.repeat(panel.periods, len(panel.series))
+    series = np.tile(panel.series, len(panel.periods))
+    return pd.DataFrame({'Period': periods, 'series': series,
+                         'sum': panel.sums.ravel(), 'count': panel.counts.ravel()})
+
+
+def _table_frame(table):
+    return pd.DataFrame(dict(table['codes'], sum=table['sum'], count=table['count']))
+
+
+def verify_database(path, source, qs=(0.1, 0.25, 0.5, 0.75, 0.9)):
+    """Check the database at ``path`` against pandas/numpy on the loaded ``source``.
+
+    Returns ``{check: largest absolute difference}`` (inf where groups,
+    counts or labels differ) for the quantiles of :data:`QUANTILE_KEYS`
+    against ``np.quantile`` and for every aggregate, panel, distribution and
+    cross-filter marginal the figure factory reads.
+    """
+    data = load_dataset(source)
+    store = SQLStore(ConnectionPool(path, size=1))
+    expected, actual = FigureFactory(data), FigureFactory(None, rollups=store)
+    results = {}
+    for value in NUMERIC_COLUMNS:
+        rows = data[data[value].notna()]
+        rows = rows.assign(**{key: DERIVED_KEYS[key](rows) for key in DERIVED_KEYS})
+        for keys in QUANTILE_KEYS:
+            result = store.quantiles(keys, qs, value)
+            if keys:
+                numpy = rows.groupby(list(keys))[value].apply(
+                    lambda x: pd.Series(np.quantile(x.to_numpy(), qs), index=qs)
+                ).unstack().reset_index()
+                result = result.sort_values(list(keys))[list(keys) + list(qs)]
+            else:
+                numpy = pd.DataFrame([np.quantile(rows[value].to_numpy(), qs)], columns=list(qs))
+                result = result[list(qs)]
+            results[f"quantiles {' x '.join(keys) or 'all'} of {value}"] = _difference(numpy, result)
+    for keys, how in ROLLUPS + [(keys, how) for keys, _ in ROLLUPS for how in ('std', 'count')]:
+        results[f"{how} per {' x '.join(keys)}"] = _difference(
+            expected._aggregate(keys, how, 'Inflation (%)'), actual._aggregate(keys, how, 'Inflation (%)')
+        )
+    for by in PANELS:
+        results[f"panel per {by}"] = _difference(_panel_frame(expected.panel(by)),
+                                                 _panel_frame(actual.panel(by)))
+    for value, by in DISTRIBUTIONS:
+        results[f"histogram of {value}"] = _difference(expected.histogram(value, by),
+                                                       actual.histogram(value, by))
+        for part, a, b in zip(('stats', 'outliers'), expected.box(value, by), actual.box(value, by)):
+            results[f"box {part} of {value}"] = _difference(a, b)
+    marginals = expected.crossfilter(), actual.crossfilter()
+    for name in CROSSFILTER_TABLES:
+        results[f"cross-filter {name}"] = (
+            _difference(*(_table_frame(tables['tables'][name]) for tables in marginals))
+            if marginals[0]['dims'] == marginals[1]['dims'] else np.inf
+        )
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default=os.environ.get('CPI_DATA', 'cpi Group data.csv'),
+                        help="CSV file, directory of CSVs or glob pattern")
+    parser.add_argument('--database', default='cpi.sqlite',
+                        help="database file to write (.duckdb for DuckDB)")
+    parser.add_argument('--chunksize', type=int, default=200_000, help="rows per read")
+    parser.add_argument('--verify', action='store_true',
+                        help="check an existing database against --data loaded in pandas")
+    parser.add_argument('--tolerance', type=float, default=1e-9,
+                        help="largest absolute difference --verify accepts")
+    args = parser.parse_args(argv)
+
+    if args.verify:
+        results = verify_database(args.database, args.data)
+        for check, difference in results.items():
+            print(f"  {'ok ' if difference <= args.tolerance else 'BAD'} {check:<50}{difference:.3g}")
+        failed = sum(difference > args.tolerance for difference in results.values())
+        if failed:
+            parser.exit(1, f"{failed} of {len(results)} checks differ\n")
+        print(f"All {len(results)} checks match")
+        return
+
+    start = time.perf_counter()
+    rows = build_database(args.data, args.database, chunksize=args.chunksize)
+    print(f"Loaded {rows} rows from {args.data} into {args.database} "
+          f"in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+"""Vectorized summaries for the distribution views.
+
+The dashboards used to hand every raw ``Index`` value to Plotly and let the
+browser bin the histograms and compute the box plot quartiles.  The helpers
+below do that work once on the server so the figures only carry summaries.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _factorize(data, value, by):
+    frame = data[[by, value]].dropna()
+    codes, labels = pd.factorize(frame[by], sort=True)
+    values = frame[value].to_numpy(dtype=float)
+    return values, codes, np.asarray(labels)
+
+
+def histogram_summary(data, value='Index', by='Group', bins='auto'):
+    """Count ``value`` per ``by`` group on one shared set of bin edges.
+
+    The edges are chosen once over all rows so every facet uses the same
+    bins and the facets stay comparable.  Returns one row per non-empty
+    (group, bin) with ``left``, ``right``, ``center`` and ``count`` columns.
+    """
+    values, codes, labels = _factorize(data, value, by)
+    if values.size == 0:
+        return pd.DataFrame(columns=[by, 'left', 'right', 'center', 'count'])
+    edges = np.histogram_bin_edges(values, bins=bins)
+    return histogram_frame(edges, values, codes, labels, by)
+
+
+def summary_bin_edges(count, low, high, iqr, bins='auto'):
+    """``np.histogram_bin_edges`` from summary statistics instead of the values.
+
+    ``bins`` is a bin count or 'auto', numpy's choice between the Sturges
+    and Freedman-Diaconis widths (the latter at least half the square-root
+    rule's width); ``iqr`` is only used for 'auto'.
+    """
+    first, last = (low - 0.5, high + 0.5) if low == high else (low, high)
+    if bins == 'auto':
+        sturges = (high - low) / (np.log2(count) + 1.0)
+        fd = max(2.0 * iqr * count ** (-1.0 / 3.0), (high - low) / np.sqrt(count) / 2)
+        width = min(fd, sturges)
+        bins = int(np.ceil((last - first) / width)) if width else 1
+    return np.linspace(first, last, int(bins) + 1)
+
+
+def histogram_frame(edges, values, codes, labels, by='Group', weights=None):
+    """Count ``values`` per group code on ``edges``, shaped like :func:`histogram_summary`.
+
+    ``weights`` counts each value more than once (e.g. distinct values with
+    their number of rows).
+    """
+    n_bins = len(edges) - 1
+    bin_idx = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, n_bins - 1)
+    counts = np.bincount(codes * n_bins + bin_idx, weights=weights,
+                         minlength=len(labels) * n_bins).astype(np.int64)
+    summary = pd.DataFrame({
+        by: np.repeat(labels, n_bins),
+        'left': np.tile(edges[:-1], len(labels)),
+        'right': np.tile(edges[1:], len(labels)),
+        'count': counts,
+    })
+    summary['center'] = (summary['left'] + summary['right']) / 2
+    return summary[summary['count'] > 0].reset_index(drop=True)
+
+
+def _rank_values(values, ends, ranks):
+    # Value at each 0-based rank of sorted ``values`` whose items stand for
+    # several rows (``ends`` is the cumulative row count)
+    return values[np.searchsorted(ends, ranks, side='right')]
+
+
+def _quantiles(values, ends, offsets, sizes, q):
+    # numpy's linear interpolation between the ranks around ``q`` per group
+    pos = offsets + q * (sizes - 1)
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.ceil(pos).astype(np.int64)
+    low, high = _rank_values(values, ends, lo), _rank_values(values, ends, hi)
+    return low + (high - low) * (pos - lo)
+
+
+def count_histogram(values, counts, codes, labels, by='Group', bins='auto'):
+    """:func:`histogram_summary` from distinct values and their row ``counts``.
+
+    The edges are computed from the count, range and quartiles of all the
+    rows, so the result is the one the rows themselves would give.
+    """
+    if values.size == 0:
+        return pd.DataFrame(columns=[by, 'left', 'right', 'center', 'count'])
+    order = np.argsort(values, kind='stable')
+    ends = np.cumsum(counts[order])
+    total = np.array([ends[-1]])
+    q1, q3 = (_quantiles(values[order], ends, 0, total, q)[0] for q in (0.25, 0.75))
+    edges = summary_bin_edges(int(total[0]), values.min(), values.max(), q3 - q1, bins)
+    return histogram_frame(edges, values, codes, labels, by, weights=counts)
+
+
+def box_summary(data, value='Index', by='Group', whisker=1.5, max_outliers=50):
+    """Quartiles, Tukey whiskers and a capped outlier sample per ``by`` group.
+
+    Returns ``(stats, outliers)``: ``stats`` has one row per group with
+    ``q1``, ``median``, ``q3``, ``lowerfence``, ``upperfence`` and ``count``;
+    ``outliers`` holds at most ``max_outliers`` evenly spaced points per group.
+    """
+    values, codes, labels = _factorize(data, value, by)
+    return box_frame(values, codes, labels, by, value, whisker=whisker, max_outliers=max_outliers)
+
+
+def box_frame(values, codes, labels, by='Group', value='Index', counts=None, whisker=1.5,
+              max_outliers=50):
+    """:func:`box_summary` of ``values`` per group code.
+
+    ``counts`` gives the number of rows behind each value (e.g. distinct
+    values with their row counts); the result is the one the rows would give.
+    """
+    if values.size == 0:
+        return (pd.DataFrame(columns=[by, 'q1', 'median', 'q3', 'lowerfence', 'upperfence', 'count']),
+                pd.DataFrame(columns=[by, value]))
+    counts = np.ones(values.size, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+    order = np.lexsort((values, codes))
+    values, codes, counts = values[order], codes[order], counts[order]
+    starts = np.searchsorted(codes, np.arange(len(labels)))
+    sizes = np.bincount(codes, weights=counts, minlength=len(labels)).astype(np.int64)
+    ends = np.cumsum(counts)
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+
+    q1, median, q3 = (_quantiles(values, ends, offsets, sizes, q) for q in (0.25, 0.5, 0.75))
+    iqr = q3 - q1
+    low_limit = (q1 - whisker * iqr)[codes]
+    high_limit = (q3 + whisker * iqr)[codes]
+    lowerfence = np.minimum.reduceat(np.where(values >= low_limit, values, np.inf), starts)
+    upperfence = np.maximum.reduceat(np.where(values <= high_limit, values, -np.inf), starts)
+    stats = pd.DataFrame({
+        by: labels, 'q1': q1, 'median': median, 'q3': q3,
+        'lowerfence': lowerfence, 'upperfence': upperfence, 'count': sizes,
+    })
+
+    out_idx = np.flatnonzero((values < low_limit) | (values > high_limit))
+    out_idx = np.repeat(out_idx, counts[out_idx])
+    kept = out_idx[thin_outliers(codes[out_idx], max_outliers)]
+    outliers = pd.DataFrame({by: labels[codes[kept]], value: values[kept]})
+    return stats, outliers
+
+
+def thin_outliers(codes, max_outliers=50):
+    """Mask evenly thinning each group of sorted ``codes`` to ``max_outliers`` points."""
+    codes = np.asarray(codes, dtype=np.int64)
+    sizes = np.bincount(codes)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    rank = np.arange(codes.size) - starts[codes]
+    n = sizes[codes]
+    slot = rank * max_outliers // np.maximum(n, 1)
+    prev_slot = (rank - 1) * max_outliers // np.maximum(n, 1)
+    keep = (rank == 0) | (slot != prev_slot)
+    if max_outliers <= 0:
+        keep[:] = False
+    return keep
+
+
+# ---------------------------------------
+# Mergeable quantile sketches
+# ---------------------------------------
+SKETCH_KEYS = ('Year', 'Month', 'Group')
+
+
+class QuantileSketch:
+    """KLL quantile sketch over a stream of floats.
+
+    Items live in a stack of compactors; an item at level ``h`` stands for
+    ``2**h`` input values.  When a level outgrows its capacity it is sorted
+    and every other item (random offset) is promoted to the next level.
+    Sketches built on separate chunks or partitions can be merged with
+    :meth:`merge`, and the rank error stays around ``epsilon`` (about
+    ``1.7 / k``) of the total count.
+    """
+
+    def __init__(self, k=200, seed=None):
+        self.k = int(k)
+        self.count = 0
+        self._levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    @classmethod
+    def from_error(cls, epsilon, seed=None):
+        """Sketch sized so the rank error is roughly ``epsilon``."""
+        return cls(k=max(8, int(np.ceil(1.7 / epsilon))), seed=seed)
+
+    @property
+    def epsilon(self):
+        return 1.7 / self.k
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def nbytes(self):
+        return sum(items.nbytes for items in self._levels)
+
+    def _capacity(self, level):
+        depth = len(self._levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        while True:
+            level = next((h for h, items in enumerate(self._levels)
+                          if len(items) > self._capacity(h)), None)
+            if level is None:
+                return
+            if level + 1 == len(self._levels):
+                self._levels.append(np.empty(0))
+            items = np.sort(self._levels[level])
+            even = len(items) - len(items) % 2
+            promoted = items[self._rng.integers(2):even:2]
+            self._levels[level] = items[even:]
+            self._levels[level + 1] = np.concatenate((self._levels[level + 1], promoted))
+
+    def update(self, values):
+        """Add an array of values; NaNs are ignored."""
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if values.size:
+            self.count += values.size
+            self._levels[0] = np.concatenate((self._levels[0], values))
+            self._compress()
+        return self
+
+    def merge(self, other):
+        """Fold ``other`` into this sketch in place and return ``self``."""
+        while len(self._levels) < len(other._levels):
+            self._levels.append(np.empty(0))
+        for level, items in enumerate(other._levels):
+            self._levels[level] = np.concatenate((self._levels[level], items))
+        self.count += other.count
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        """Approximate quantile(s) ``q`` in [0, 1]; NaN for an empty sketch."""
+        q = np.asarray(q, dtype=float)
+        if self.count == 0:
+            return np.full(q.shape, np.nan)[()]
+        items = np.concatenate(self._levels)
+        weights = np.concatenate([np.full(len(items_), 2 ** h, dtype=float)
+                                  for h, items_ in enumerate(self._levels)])
+        order = np.argsort(items, kind='stable')
+        weights = weights[order]
+        # Interpolate between item mid-ranks so small, uncompacted sketches
+        # reproduce the exact (pandas-style) median.
+        centers = np.cumsum(weights) - weights / 2
+        return np.interp(q * weights.sum(), centers, items[order])[()]
+
+    def median(self):
+        return self.quantile(0.5)
+
+
+def build_sketches(frames, value='Inflation (%)', keys=SKETCH_KEYS, k=200, sketches=None):
+    """Sketch ``value`` per ``keys`` over a frame or an iterable of chunks.
+
+    Pass an existing ``sketches`` dict to keep accumulating into it, e.g.
+    when reading with ``pd.read_csv(..., chunksize=...)``.
+    """
+    if isinstance(frames, pd.DataFrame):
+        frames = [frames]
+    sketches = {} if sketches is None else sketches
+    keys = list(keys)
+    for chunk in frames:
+        for key, group in chunk.groupby(keys, sort=False)[value]:
+            if key not in sketches:
+                sketches[key] = QuantileSketch(k=k)
+            sketches[key].update(group.to_numpy())
+    return sketches
+
+
+def merge_sketches(*tables):
+    """Merge several key -> sketch dicts (e.g. from different partitions)."""
+    merged = {}
+    for table in tables:
+        for key, sketch in table.items():
+            if key in merged:
+                merged[key].merge(sketch)
+            else:
+                merged[key] = QuantileSketch(k=sketch.k).merge(sketch)
+    return merged
+
+
+def sketch_quantiles(sketches, by, keys=SKETCH_KEYS, q=0.5, value='Inflation (%)'):
+    """Roll sketches up to the ``by`` subset of ``keys`` and read quantile ``q``.
+
+    ``sketch_quantiles(sketches, ['Year', 'Month'])`` gives the monthly
+    median by year used by Vis 5 without touching the raw rows.
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    positions = [list(keys).index(col) for col in by]
+    rolled = {}
+    for key, sketch in sketches.items():
+        sub = tuple(key[i] for i in positions)
+        if sub in rolled:
+            rolled[sub].merge(sketch)
+        else:
+            rolled[sub] = QuantileSketch(k=sketch.k).merge(sketch)
+    rows = [sub + (sketch.quantile(q),) for sub, sketch in rolled.items()]
+    return pd.DataFrame(rows, columns=by + [value]).sort_values(by).reset_index(drop=True)
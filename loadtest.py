@@ -0,0 +1,380 @@
+"""Concurrent-user load test for the Dash server.
+
+    python loadtest.py --workers 4 --users 20 --duration 60 --json w4.json
+
+Starts ``gunicorn app:server`` locally (or targets ``--url``), then replays
+browser-like sessions from N simulated users: the index page, the Dash
+layout and dependencies, the component-suite/asset bundles referenced by
+the page, every server-side callback with the option values a user could
+pick and the page data a rendered page fetches (``page-data-url``).  Reports throughput, p50/p95/p99 latency and bytes per request
+kind, the mean response bytes per interaction (any callback but a page
+render) and the gunicorn workers' RSS, and can write the results as JSON
+so runs with different worker counts, threads or environment flags can be
+compared.
+"""
+import argparse
+import gzip
+import http.client
+import itertools
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import numpy as np
+
+ASSET_RE = re.compile(r'(?:src|href)="([^"]*(?:_dash-component-suites|assets)/[^"]+)"')
+
+
+# -------------------------------
+# Server process and RSS sampling
+# -------------------------------
+# gunicorn puts its working directory first on sys.path, where the repo's
+# Streamlit dash.py would shadow the dash package.  The server is started
+# from a scratch directory holding this shim instead, which appends the repo
+# to the path and moves back to the caller's directory (for relative
+# CPI_DATA paths) before importing the app.
+SHIM = """import os
+import sys
+
+sys.path.append({repo!r})
+os.chdir({cwd!r})
+from {module} import {attr} as application
+"""
+
+
+def start_server(app, port, workers, threads, env, shim_dir, timeout=120):
+    module, _, attr = app.partition(':')
+    with open(os.path.join(shim_dir, 'loadtest_app.py'), 'w') as fh:
+        fh.write(SHIM.format(repo=os.path.dirname(os.path.abspath(__file__)), cwd=os.getcwd(),
+                             module=module, attr=attr or 'application'))
+    cmd = [sys.executable, '-m', 'gunicorn', 'loadtest_app:application',
+           '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--threads', str(threads)]
+    proc = subprocess.Popen(cmd, env=dict(os.environ, **env), cwd=shim_dir)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {proc.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            conn.request('GET', '/_dash-layout')
+            if conn.getresponse().status == 200:
+                return proc
+        except OSError:
+            pass
+        time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError("gunicorn did not become ready in time")
+
+
+def _children(pid):
+    kids = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as fh:
+                    fields = fh.read().rsplit(')', 1)[1].split()
+            except OSError:
+                continue
+            if int(fields[1]) == pid:
+                kids.append(int(entry))
+    return kids
+
+
+def _rss_bytes(pid):
+    try:
+        with open(f'/proc/{pid}/status') as fh:
+            for line in fh:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def worker_rss(master_pid):
+    """RSS of each gunicorn worker (children of the master), in bytes."""
+    return [_rss_bytes(pid) for pid in _children(master_pid)]
+
+
+# -------------------------------
+# Session model
+# -------------------------------
+def _walk_layout(node, found):
+    if isinstance(node, list):
+        for child in node:
+            _walk_layout(child, found)
+    elif isinstance(node, dict):
+        props = node.get('props')
+        if isinstance(props, dict):
+            if isinstance(props.get('id'), str):
+                found[props['id']] = props
+            for value in props.values():
+                _walk_layout(value, found)
+        else:
+            # Callback responses nest components under {id: {prop: value}}
+            for value in node.values():
+                _walk_layout(value, found)
+
+
+def _split_outputs(output):
+    # Multi-output callbacks are encoded as "..a.prop...b.prop.."
+    parts = output.strip('.').split('...') if output.startswith('..') else [output]
+    return [dict(zip(('id', 'property'), part.rsplit('.', 1))) for part in parts]
+
+
+# dcc.Location properties: callbacks driven only by these render a page on
+# navigation rather than answer a user interaction
+LOCATION_PROPS = {'pathname', 'search', 'hash', 'href'}
+
+# dcc.Store whose data is the URL a rendered page GETs its figures from
+DATA_URL_ID = 'page-data-url'
+
+
+def callback_requests(layout, dependencies):
+    """Build one request body per (server-side callback, input choice).
+
+    Page renders are labelled ``render:<output>``, everything else
+    ``callback:<output>``.
+    """
+    props = {}
+    _walk_layout(layout, props)
+    requests = []
+    for dep in dependencies:
+        if dep.get('clientside_function') or dep['output'].startswith('{'):
+            continue
+        outputs = _split_outputs(dep['output'])
+        render = all(i['property'] in LOCATION_PROPS for i in dep['inputs'])
+        kind = ('render:' if render else 'callback:') + dep['output'].strip('.')
+        inputs = [dict(i, value=props.get(i['id'], {}).get(i['property'])) for i in dep['inputs']]
+        state = [dict(s, value=props.get(s['id'], {}).get(s['property'])) for s in dep.get('state', [])]
+        # Replay every option of each input that has a choice list
+        variants = []
+        for i, item in enumerate(inputs):
+            options = props.get(item['id'], {}).get('options') or []
+            for option in options:
+                value = option.get('value') if isinstance(option, dict) else option
+                variants.append((i, value))
+        variants = variants or [(None, None)]
+        for index, value in variants:
+            body_inputs = [dict(item) for item in inputs]
+            changed = []
+            if index is not None:
+                body_inputs[index]['value'] = value
+                changed = [f"{body_inputs[index]['id']}.{body_inputs[index]['property']}"]
+            requests.append((kind, dict(
+                output=dep['output'],
+                outputs=outputs if len(outputs) > 1 else outputs[0],
+                inputs=body_inputs, state=state, changedPropIds=changed,
+            )))
+    return requests
+
+
+class User(threading.Thread):
+    def __init__(self, host, port, prefix, deadline, think_time, asset_cache, results):
+        super().__init__(daemon=True)
+        self.host, self.port, self.prefix = host, port, prefix
+        self.deadline, self.think_time = deadline, think_time
+        self.asset_cache = asset_cache
+        self.results = results
+        self.sessions = 0
+        # path -> (ETag, body) kept by a warm browser for conditional GETs
+        self.validators = {}
+
+    def _request(self, kind, method, path, body=None):
+        headers = {'Accept-Encoding': 'gzip'}
+        if body is not None:
+            body = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        elif self.asset_cache and path in self.validators:
+            headers['If-None-Match'] = self.validators[path][0]
+        start = time.perf_counter()
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            payload = response.read()
+            ok = response.status < 400
+            size = len(payload)
+            if response.getheader('Content-Encoding') == 'gzip':
+                payload = gzip.decompress(payload)
+            if response.status == 304:
+                payload = self.validators[path][1]
+            elif self.asset_cache and response.getheader('ETag'):
+                self.validators[path] = (response.getheader('ETag'), payload)
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            payload, ok, size = b'', False, 0
+        self.results.append((kind, time.perf_counter() - start, size, ok))
+        return payload if ok else None
+
+    def _fetch_page_data(self, response):
+        # What the page's clientside loader fetches (revalidated when warm)
+        props = {}
+        _walk_layout(response, props)
+        url = props.get(DATA_URL_ID, {}).get('data')
+        if url:
+            self._request('data', 'GET', url)
+
+    def session(self, first):
+        index = self._request('page', 'GET', self.prefix)
+        layout = self._request('layout', 'GET', self.prefix + '_dash-layout')
+        deps = self._request('dependencies', 'GET', self.prefix + '_dash-dependencies')
+        if index and (first or not self.asset_cache):
+            for asset in ASSET_RE.findall(index.decode('utf-8', 'replace')):
+                self._request('asset', 'GET', urllib.parse.urljoin(self.prefix, asset))
+        if not (layout and deps):
+            return
+        tree, deps, sent = [json.loads(layout)], json.loads(deps), set()
+        # Components rendered by a callback (e.g. a routed page) only become
+        # reachable once its response arrives, so replay until nothing is new
+        while True:
+            pending = [(kind, body) for kind, body in callback_requests(tree, deps)
+                       if json.dumps(body, sort_keys=True) not in sent]
+            if not pending:
+                return
+            for kind, body in pending:
+                if time.time() > self.deadline:
+                    return
+                sent.add(json.dumps(body, sort_keys=True))
+                time.sleep(self.think_time)
+                response = self._request(kind, 'POST', self.prefix + '_dash-update-component', body)
+                if response:
+                    tree.append(json.loads(response).get('response'))
+                    self._fetch_page_data(tree[-1])
+
+    def run(self):
+        self.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        for n in itertools.count():
+            if time.time() > self.deadline:
+                break
+            self.session(first=n == 0)
+            self.sessions += 1
+        self.conn.close()
+
+
+# -------------------------------
+# Reporting
+# -------------------------------
+def summarize(results, elapsed, rss_samples):
+    kinds = {}
+    for kind, latency, size, ok in results:
+        kinds.setdefault(kind, []).append((latency, size, ok))
+    rows = {}
+    for kind, samples in sorted(kinds.items()):
+        latencies = np.array([s[0] for s in samples]) * 1000
+        rows[kind] = dict(
+            requests=len(samples),
+            errors=sum(not s[2] for s in samples),
+            bytes_mean=float(np.mean([s[1] for s in samples])),
+            p50_ms=float(np.percentile(latencies, 50)),
+            p95_ms=float(np.percentile(latencies, 95)),
+            p99_ms=float(np.percentile(latencies, 99)),
+        )
+    all_latencies = np.array([r[1] for r in results]) * 1000 if results else np.zeros(1)
+    # Every callback request other than a page render is one user interaction
+    # (a filter, grain, form or month change); its response bytes are what
+    # the interaction costs
+    interactions = [r[2] for r in results if r[0].startswith('callback:') and r[3]]
+    peak = max(rss_samples, key=sum) if rss_samples else []
+    return dict(
+        elapsed_s=elapsed,
+        requests=len(results),
+        errors=sum(not r[3] for r in results),
+        throughput_rps=len(results) / elapsed if elapsed else 0.0,
+        p50_ms=float(np.percentile(all_latencies, 50)),
+        p95_ms=float(np.percentile(all_latencies, 95)),
+        p99_ms=float(np.percentile(all_latencies, 99)),
+        worker_rss_mb=[round(b / 2**20, 1) for b in peak],
+        total_rss_mb=round(sum(peak) / 2**20, 1),
+        interactions=len(interactions),
+        interaction_bytes_mean=float(np.mean(interactions)) if interactions else 0.0,
+        by_kind=rows,
+    )
+
+
+def print_summary(summary, label):
+    print(f"\n== {label} ==")
+    print(f"{summary['requests']} requests in {summary['elapsed_s']:.1f}s "
+          f"({summary['throughput_rps']:.1f} req/s, {summary['errors']} errors)")
+    print(f"latency p50 {summary['p50_ms']:.1f} ms  p95 {summary['p95_ms']:.1f} ms  "
+          f"p99 {summary['p99_ms']:.1f} ms")
+    if summary['interactions']:
+        print(f"{summary['interactions']} interactions, "
+              f"{summary['interaction_bytes_mean'] / 1024:.1f} KB per interaction")
+    if summary['worker_rss_mb']:
+        print(f"peak worker RSS {summary['worker_rss_mb']} MB (total {summary['total_rss_mb']} MB)")
+    print(f"{'kind':<40}{'reqs':>7}{'err':>5}{'KB':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for kind, row in summary['by_kind'].items():
+        print(f"{kind[:39]:<40}{row['requests']:>7}{row['errors']:>5}{row['bytes_mean'] / 1024:>9.1f}"
+              f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help="test a running server instead of starting gunicorn")
+    parser.add_argument('--app', default='app:server')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help="environment for the server (repeatable)")
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds")
+    parser.add_argument('--think-time', type=float, default=0.0, help="pause between callbacks (s)")
+    parser.add_argument('--asset-cache', action='store_true',
+                        help="warm browser cache: users fetch assets only in their first "
+                             "session and revalidate pages with If-None-Match")
+    parser.add_argument('--label', help="name for this configuration in the report")
+    parser.add_argument('--json', help="write the summary to this file")
+    args = parser.parse_args(argv)
+
+    proc = None
+    shim_dir = tempfile.TemporaryDirectory(prefix='cpi-loadtest-')
+    if args.url:
+        target = urllib.parse.urlsplit(args.url)
+        host, port, prefix = target.hostname, target.port or 80, target.path or '/'
+    else:
+        env = dict(item.split('=', 1) for item in args.env)
+        proc = start_server(args.app, args.port, args.workers, args.threads, env, shim_dir.name)
+        host, port, prefix = '127.0.0.1', args.port, '/'
+    if not prefix.endswith('/'):
+        prefix += '/'
+
+    results, rss_samples = [], []
+    try:
+        start = time.time()
+        users = [User(host, port, prefix, start + args.duration, args.think_time,
+                      args.asset_cache, results) for _ in range(args.users)]
+        for user in users:
+            user.start()
+        while any(user.is_alive() for user in users):
+            if proc is not None:
+                rss_samples.append(worker_rss(proc.pid))
+            time.sleep(0.5)
+        elapsed = time.time() - start
+    finally:
+        if proc is not None:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(timeout=30)
+        shim_dir.cleanup()
+
+    label = args.label or args.url or ' '.join(
+        [f"workers={args.workers}", f"threads={args.threads}"] + args.env)
+    summary = summarize(results, elapsed, rss_samples)
+    summary.update(label=label, users=args.users, sessions=sum(u.sessions for u in users),
+                   config=dict(vars(args)))
+    print_summary(summary, label)
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(summary, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
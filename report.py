@@ -0,0 +1,132 @@
+"""Render the dashboard figures into one self-contained, offline HTML report.
+
+    python report.py --data "cpi Group data.csv" --output cpi_report.html
+
+plotly.js is embedded once for the whole report (instead of once per
+exported figure).  The dataset is loaded and the aggregates the figures
+share are computed once, then the figures are built and serialized in
+parallel worker processes by the same factory the apps use, so they carry
+the same reduced payloads.
+"""
+import argparse
+import datetime
+import html
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import plotly.io as pio
+from plotly.offline import get_plotlyjs
+
+from cpi_figures import FigureFactory
+from cpi_loader import load_dataset
+
+# Report sections in dashboard tab order: (heading, figure names)
+REPORT_SECTIONS = [
+    ("Vis 1: Inflation by Group", ['vis1']),
+    ("Vis 2: Inflation by Year", ['vis2']),
+    ("Vis 3: Inflation by States", ['vis3']),
+    ("Vis 4: Inflation by Month & State", ['vis4']),
+    ("Vis 5: Median Inflation", ['vis5']),
+    ("Vis 6: Contribution Analysis", ['vis6']),
+    ("Vis 7: Distribution", ['vis7_hist', 'vis7_box']),
+    ("Vis 8: Dynamic Time Analysis", ['vis8']),
+    ("Vis 9: Sector Analysis", ['vis9']),
+    ("Vis 10: Group & Sector", ['vis10']),
+    ("Vis 11: Moving Std Dev", ['vis11']),
+    ("Vis 12: Volatility", ['vis12']),
+]
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: Arial, sans-serif; background: #f8f9fa; margin: 0 auto; max-width: 1200px; padding: 20px; }}
+h1 {{ color: #2fa4e7; }}
+section {{ background: white; margin: 20px 0; padding: 10px 20px; }}
+.figure {{ height: 550px; }}
+</style>
+<script type="text/javascript">{plotlyjs}</script>
+</head>
+<body>
+<h1>{title}</h1>
+<p>Generated {generated} from {source}.</p>
+{sections}
+<script type="text/javascript">
+var figures = {figures};
+Object.keys(figures).forEach(function (id) {{
+    Plotly.newPlot(id, figures[id].data, figures[id].layout, {{responsive: true}});
+}});
+</script>
+</body>
+</html>
+"""
+
+_factory = None
+
+
+def _init_worker(cache, theme):
+    global _factory
+    # Workers never see the rows, only the aggregates prepared by the parent
+    _factory = (FigureFactory(None, cache=cache), theme)
+
+
+def _render(name):
+    factory, theme = _factory
+    return name, pio.to_json(factory.figure(name, theme), validate=False)
+
+
+def build_figures(source, theme='light', workers=None):
+    """Build every report figure; returns ``{name: figure JSON}``."""
+    names = [name for _, section in REPORT_SECTIONS for name in section]
+    cache = {}
+    FigureFactory(load_dataset(source), cache=cache).prepare()
+    if workers == 1:
+        _init_worker(cache, theme)
+        return dict(map(_render, names))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(cache, theme)) as pool:
+        return dict(pool.map(_render, names))
+
+
+def render_report(figures, title="Inflation Dashboard", source=""):
+    sections = []
+    for heading, names in REPORT_SECTIONS:
+        divs = ''.join(f'<div class="figure" id="{name}"></div>' for name in names)
+        sections.append(f'<section><h2>{html.escape(heading)}</h2>{divs}</section>')
+    payload = '{' + ','.join(f'"{name}":{spec}' for name, spec in figures.items()) + '}'
+    return PAGE.format(
+        title=html.escape(title),
+        plotlyjs=get_plotlyjs(),
+        generated=datetime.datetime.now().strftime('%Y-%m-%d %H:%M'),
+        source=html.escape(str(source)),
+        sections='\n'.join(sections),
+        # Keep "</script>" inside figure text from closing the script tag
+        figures=payload.replace('</', '<\\/'),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default=os.environ.get('CPI_DATA', 'cpi Group data.csv'),
+                        help="CSV file, directory of CSVs or glob pattern")
+    parser.add_argument('--output', default='cpi_report.html')
+    parser.add_argument('--theme', default='light')
+    parser.add_argument('--title', default='Inflation Dashboard')
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: one per core; 1 builds in-process)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    figures = build_figures(args.data, theme=args.theme, workers=args.workers)
+    page = render_report(figures, title=args.title, source=args.data)
+    with open(args.output, 'w', encoding='utf-8') as fh:
+        fh.write(page)
+    print(f"Wrote {args.output} ({len(page) / 2**20:.1f} MB, {len(figures)} figures) "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from cpi_panel import Panel
+
+
+def _rows(periods, series, values):
+    return pd.DataFrame({'Period': periods, 'Sector': series, 'Inflation (%)': values})
+
+
+def test_rolling_std_skips_missing_periods():
+    rng = np.random.default_rng(0)
+    periods = np.arange(24_000, 24_024)
+    # Rural misses three months, Urban has one stray month at the end
+    rural = np.delete(periods, [4, 5, 11])
+    urban = periods[:20]
+    data = pd.concat([
+        _rows(rural, 'Rural', rng.normal(5, 2, len(rural))),
+        _rows(urban, 'Urban', rng.normal(4, 1, len(urban))),
+        _rows([periods[-1]], 'Urban', [9.0]),
+    ], ignore_index=True)
+
+    panel = Panel.from_frame(data, 'Sector')
+    result = panel.rolling_std(5, min_periods=1)
+
+    expected = data.groupby('Sector')['Inflation (%)'].transform(
+        lambda x: x.rolling(5, min_periods=1).std()
+    )
+    rows = pd.Index(panel.periods).get_indexer(data['Period'])
+    columns = pd.Index(panel.series).get_indexer(data['Sector'])
+    np.testing.assert_allclose(result[rows, columns], expected.to_numpy(), rtol=1e-9, atol=1e-12)
+
+    # Cells without a value stay empty
+    assert np.isnan(result[~panel.counts.astype(bool)]).all()